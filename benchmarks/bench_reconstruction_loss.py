@@ -0,0 +1,69 @@
+'''
+Microbenchmark of the weighted reconstruction loss (loss_2nd).
+Compare the former dense form, which builds B = ones_like(X) with B[X != 0] = beta every step, with
+second_order_loss, which applies beta from the non-zero entries of the batch.
+Allocations are the bytes allocated by torch during one forward + backward step.
+
+Run: python -m benchmarks.bench_reconstruction_loss
+'''
+from time import time
+
+import numpy as np
+import scipy.sparse as sparse
+import torch
+
+from src.data_preprocessing.graph_preprocessing import get_edge_index
+from src.utils.losses import second_order_loss
+
+
+def dense_loss_2nd(X_hat, X, beta):
+    B = torch.ones_like(X)
+    B[X != 0] = beta
+    return torch.sum(torch.square((X_hat - X) * B))
+
+
+def measure(step, repeat=5):
+    with torch.autograd.profiler.profile(profile_memory=True) as prof:
+        step()
+    allocated = sum(e.self_cpu_memory_usage for e in prof.key_averages() if e.self_cpu_memory_usage > 0)
+
+    t1 = time()
+    for _ in range(repeat):
+        step()
+    return allocated, (time() - t1) / repeat
+
+
+def run(batch_size=1024, node_size=50000, density=1e-3, beta=10., seed=6):
+    torch.manual_seed(seed)
+    A_train = sparse.random(batch_size, node_size, density=density, format='csr', dtype=np.float32,
+                            random_state=seed)
+    A_train.data[:] = 1.
+    x_index, x_value = get_edge_index(A_train)
+    x_index, x_value = torch.tensor(x_index), torch.tensor(x_value)
+    X = torch.tensor(A_train.toarray())
+    X_hat = torch.rand(batch_size, node_size, requires_grad=True)
+
+    def dense_step():
+        X_hat.grad = None
+        dense_loss_2nd(X_hat, X, beta).backward()
+
+    def sparse_step():
+        X_hat.grad = None
+        second_order_loss(X_hat, x_index, x_value, beta).backward()
+
+    dense_loss = dense_loss_2nd(X_hat, X, beta)
+    sparse_loss = second_order_loss(X_hat, x_index, x_value, beta)
+    dense_grad = torch.autograd.grad(dense_loss, X_hat)[0]
+    sparse_grad = torch.autograd.grad(sparse_loss, X_hat)[0]
+    print(f"Batch=({batch_size}, {node_size})\tnnz={A_train.nnz}")
+    print(f"Loss dense={dense_loss.item():.4f}\tsparse={sparse_loss.item():.4f}\t"
+          f"max grad diff={float(torch.max(torch.abs(dense_grad - sparse_grad))):.2e}")
+
+    dense_alloc, dense_time = measure(dense_step)
+    sparse_alloc, sparse_time = measure(sparse_step)
+    print(f"Dense\t\tallocated={dense_alloc / 2 ** 20:.2f}MB\ttime={dense_time * 1000:.2f}ms")
+    print(f"Sparse\t\tallocated={sparse_alloc / 2 ** 20:.2f}MB\ttime={sparse_time * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    run()
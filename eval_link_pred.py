@@ -36,7 +36,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
 
     print("Origin graphs:")
@@ -62,7 +63,10 @@ if __name__ == "__main__":
         print("=============== DynGEM ============")
         # -------- Training ----------
         dy_embeddings = load_dy_embeddings(params.dyge_emb_folder, index=len(graphs) - 1)
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[-1])
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[-1],
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
         if is_mAP_eval:
             k_query_res, AP = check_link_predictionK(embedding=dy_embeddings[-1], train_graph=g_hidden_partial,
                                                      origin_graph=orginial_graph,
@@ -76,7 +80,10 @@ if __name__ == "__main__":
         print("=============== Node2vec ============")
         # Just need train last graph
         dy_embeddings = load_node2vec_embeddings(graphs, folder_path=params.node2vec_emb_folder, index=len(graphs) - 1)
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[-1])
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[-1],
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
 
         if is_mAP_eval:
             k_query_res, AP = check_link_predictionK(embedding=dy_embeddings[-1], train_graph=g_hidden_partial,
@@ -92,7 +99,10 @@ if __name__ == "__main__":
         print("=============== SDNE ============")
         dy_embeddings = load_dy_embeddings(folder_path=params.sdne_emb_folder, index=len(graphs) - 1)
 
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0])
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0],
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
         if is_mAP_eval:
             k_query_res, AP = check_link_predictionK(embedding=dy_embeddings[-1], train_graph=g_hidden_partial,
                                                      origin_graph=orginial_graph,
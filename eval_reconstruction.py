@@ -20,6 +20,7 @@ if __name__ == "__main__":
 
         # 'folder_paths': {
         'dataset_folder': f"./data/{dataset_name}",
+        'compiled_dataset_folder': f"./saved_data/compiled/{dataset_name}",
         'processed_link_pred_data_folder': f"./saved_data/processed_data/{dataset_name}_stability",
 
         'dyge_emb_folder': f"./saved_data/embeddings/{dataset_name}_stability",
@@ -34,7 +35,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
 
     print("Origin graphs:")
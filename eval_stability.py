@@ -33,7 +33,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
 
     print("Origin graphs:")
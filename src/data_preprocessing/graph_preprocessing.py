@@ -1,9 +1,14 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from os import listdir
 from os.path import isfile, join, exists
 from time import time
 import networkx as nx
 import numpy as np
+import pandas as pd
 import torch
+from scipy import sparse
 
 
 def get_graph_from_file(filename):
@@ -13,29 +18,171 @@ def get_graph_from_file(filename):
     return G
 
 
-# def convert_sparse_matrix_to_sparse_tensor(X):
-#     coo = X.tocoo()
-#     indices = np.mat([coo.row, coo.col]).transpose()
-#     return SparseTensor(indices, coo.data, coo.shape)
+def read_edge_list(filename):
+    '''
+    Parse an edge list file ("u v [weight]" per line, "#" comments) with the pandas C tokenizer.
+    :param filename:
+    :return: edges int64 array (|E|, 2) and weight float32 array (|E|,) or None if the file has no weight column
+    '''
+    if filename is None:
+        raise AssertionError("File name is None!")
+    try:
+        df = pd.read_csv(filename, sep=r'\s+', comment='#', header=None)
+    except pd.errors.EmptyDataError:
+        return np.empty((0, 2), dtype=np.int64), None
+    edges = df.iloc[:, :2].to_numpy(dtype=np.int64)
+    weight = df.iloc[:, 2].to_numpy(dtype=np.float32) if df.shape[1] > 2 else None
+    return edges, weight
+
+
+def read_edge_lists(filenames, workers=None):
+    '''
+    Parse several edge list files concurrently in a process pool.
+    :param filenames:
+    :param workers: number of processes. Default is the number of CPUs. 1 reads the files in the current process
+    :return: list of (edges, weight), see read_edge_list
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(filenames))
+    if workers <= 1:
+        return [read_edge_list(filename) for filename in filenames]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_edge_list, filenames))
 
 
-def next_datasets(A, L, batch_size):
+def get_idx2node(node_arrays):
     '''
+    Global node index of a sequence of snapshots, in order of first appearance over the concatenated node arrays.
+    :param node_arrays: list of int64 arrays of node ids (repetitions allowed)
+    :return: idx2node int64 array, cumulative number of nodes at each snapshot
+    '''
+    node_arrays = [np.asarray(nodes, dtype=np.int64).ravel() for nodes in node_arrays]
+    all_nodes = np.concatenate(node_arrays) if len(node_arrays) > 0 else np.empty(0, dtype=np.int64)
+    nodes, first = np.unique(all_nodes, return_index=True)
+    order = np.argsort(first, kind='stable')
+    ends = np.cumsum([len(nodes_i) for nodes_i in node_arrays])
+    node_sizes = np.searchsorted(first[order], ends, side='left')
+    return nodes[order], node_sizes.tolist()
 
-    :param A:
-    :param L:
-    :param batch_size:
+
+def map_node_to_idx(values, idx2node, sorter=None):
+    '''
+    Indices of node ids. Every value must be in idx2node.
+    :param values: int array of node ids, any shape
+    :param idx2node: int64 array
+    :param sorter: np.argsort(idx2node), when mapping several arrays
+    :return: int64 array of the shape of values
+    '''
+    if sorter is None:
+        sorter = np.argsort(idx2node, kind='stable')
+    return sorter[np.searchsorted(idx2node, values, sorter=sorter)].astype(np.int64)
+
+
+def index_edge_lists(edge_lists):
+    '''
+    Re-index the edge lists of a sequence of snapshots, see get_idx2node.
+    :param edge_lists: list of edges int64 arrays (|E_i|, 2)
+    :return: idx2node int64 array, edges of each snapshot in indices, cumulative number of nodes at each snapshot
+    '''
+    idx2node, node_sizes = get_idx2node(edge_lists)
+    sorter = np.argsort(idx2node, kind='stable')
+    indexed_edges = [map_node_to_idx(np.asarray(edges, dtype=np.int64).reshape(-1, 2), idx2node, sorter)
+                     for edges in edge_lists]
+    return idx2node, indexed_edges, node_sizes
+
+
+def edge_list_to_csr(edges, weight=None, node_size=None):
+    '''
+    Symmetric adjacency matrix of an undirected edge list. As in networkx, a repeated edge keeps its last weight.
+    :param edges: int64 array (|E|, 2) of node indices
+    :param weight: float32 array (|E|,) or None for weight 1
+    :param node_size: number of rows. Default is max node index + 1
+    :return: csr matrix (node_size x node_size) with float32 entries
+    '''
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    if node_size is None:
+        node_size = int(edges.max()) + 1 if len(edges) > 0 else 0
+    if weight is None:
+        weight = np.ones(len(edges), dtype=np.float32)
+    # Both directions of line j are at positions 2j and 2j + 1
+    row = edges.ravel()
+    col = edges[:, ::-1].ravel()
+    data = np.repeat(np.asarray(weight, dtype=np.float32), 2)
+
+    key = row * node_size + col
+    _, last = np.unique(key[::-1], return_index=True)
+    keep = len(key) - 1 - last
+    return sparse.csr_matrix((data[keep], (row[keep], col[keep])), shape=(node_size, node_size), dtype=np.float32)
+
+
+def edge_list_to_graph(edges, weight=None):
+    '''
+    Undirected graph of an edge list in a canonical order: sorted nodes, then edges sorted by (min, max) endpoints.
+    The graph, and so the rows of its adjacency matrix, do not depend on the order of the lines of the source (edge
+    list file or compiled store). As in networkx, a repeated edge keeps its last weight.
+    :param edges: int64 array (|E|, 2)
+    :param weight: float32 array (|E|,) or None
+    :return:
+    '''
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    # lexsort is stable: repeated edges keep their relative order
+    order = np.lexsort((edges[:, 1], edges[:, 0]))
+    edges = edges[order]
+    G = nx.Graph()
+    G.add_nodes_from(np.unique(edges).tolist())
+    if weight is None:
+        G.add_edges_from(edges.tolist())
+    else:
+        weight = np.asarray(weight)[order]
+        G.add_weighted_edges_from(zip(edges[:, 0].tolist(), edges[:, 1].tolist(), weight.tolist()))
+    return G
+
+
+def get_edge_index(A):
+    '''
+    Edge list of a sparse adjacency matrix
+    :param A: adjacency matrix in scipy sparse format
+    :return: edge_index with shape (2, |E|) and edge_weight with shape (|E|,)
+    '''
+    coo = A.tocoo()
+    edge_index = np.vstack((coo.row, coo.col)).astype(np.int64)
+    return edge_index, coo.data
+
+
+def convert_sparse_matrix_to_sparse_tensor(X):
+    '''
+    Convert a scipy sparse matrix to a torch sparse COO tensor without going through a dense matrix
+    :param X: scipy sparse matrix
     :return:
     '''
+    edge_index, edge_weight = get_edge_index(X)
+    return torch.sparse_coo_tensor(torch.tensor(edge_index), torch.tensor(edge_weight), X.shape).coalesce()
+
+
+def next_datasets(A, batch_size, shuffle=False):
+    '''
+    Iterate over the graph by mini-batches of nodes. Only the rows of the batch are materialized, so peak memory
+    is O(batch_size x N) instead of O(N^2).
+    :param A: adjacency matrix in csr format
+    :param batch_size:
+    :param shuffle: visit nodes in a random order
+    :return: step index and [A_train, edge_index, edge_weight]. A_train = A[index, :] in csr format. edge_index and
+        edge_weight are the edges among the batch nodes, in local indices of the batch.
+    '''
     dataset_size = A.shape[0]
     steps_per_epoch = (dataset_size - 1) // batch_size + 1
+    if shuffle:
+        order = np.random.permutation(dataset_size)
+    else:
+        order = np.arange(dataset_size)
+
     i = 0
     while i < steps_per_epoch:
-        index = np.arange(
-            i * batch_size, min((i + 1) * batch_size, dataset_size))
-        A_train = A[index, :].todense()
-        L_train = L[index][:, index].todense()
-        batch_inp = [A_train, L_train]
+        index = order[i * batch_size: min((i + 1) * batch_size, dataset_size)]
+        A_train = A[index, :]
+        edge_index, edge_weight = get_edge_index(A_train[:, index])
+        batch_inp = [A_train, edge_index, edge_weight]
 
         yield i, batch_inp
         i += 1
@@ -78,67 +225,192 @@ def convert_node2idx(g: nx.Graph):
     return node2idx
 
 
+def _graph_nodes(g: nx.Graph):
+    return np.fromiter(g.nodes, dtype=np.int64, count=g.number_of_nodes())
+
+
+def _graph_edges(g: nx.Graph):
+    return np.array(list(g.edges()), dtype=np.int64).reshape(-1, 2)
+
+
 def get_dyn_graph_to_idx(graphs: []):
-    node2idx = {}
-    idx2node = []
-    node_count = 0
-    for node in graphs[0].nodes:
-        node2idx[node] = node_count
-        idx2node.append(node)
-        node_count += 1
-
-    for i in range(1, len(graphs)):
-        add_nodes = list(set(graphs[i].nodes) - set(graphs[i - 1].nodes))
-        for node in add_nodes:
-            node2idx[node] = node_count
-            idx2node.append(node)
-            node_count += 1
+    idx2node, _ = get_idx2node([_graph_nodes(g) for g in graphs])
+    node2idx = dict(zip(idx2node.tolist(), range(len(idx2node))))
     return node2idx, idx2node
 
 
-def convert_graphs_to_idx(graphs):
-    graphs_len = len(graphs)
-
+def convert_graphs_to_idx(graphs, as_csr=False):
+    '''
+    Re-index the nodes of a sequence of snapshots to 0..N-1 in order of first appearance.
+    :param graphs: list of networkx graphs
+    :param as_csr: return binary CSR adjacency matrices. Snapshot i has the shape of the number of nodes seen up to
+        snapshot i
+    :return: graphs (networkx graphs or CSR matrices), idx2node int64 array
+    '''
     print("Start convert graph to index ...", end=" ")
     start_time = time()
 
-    dfs = []
-    for i in range(graphs_len):
-        df = nx.to_pandas_edgelist(graphs[i])
-        dfs.append(df)
-
-    node2idx, idx2node = get_dyn_graph_to_idx(graphs)
-
-    graphs2idx = []
-    for i in range(graphs_len):
-        dfs[i]['source'] = dfs[i]['source'].apply(lambda x: node2idx[x])
-        dfs[i]['target'] = dfs[i]['target'].apply(lambda x: node2idx[x])
-        g = nx.from_pandas_edgelist(dfs[i])
-        graphs2idx.append(g)
+    idx2node, node_sizes = get_idx2node([_graph_nodes(g) for g in graphs])
+    sorter = np.argsort(idx2node, kind='stable')
+    indexed_edges = [map_node_to_idx(_graph_edges(g), idx2node, sorter) for g in graphs]
+    if as_csr:
+        graphs2idx = [edge_list_to_csr(edges, node_size=node_size)
+                      for edges, node_size in zip(indexed_edges, node_sizes)]
+    else:
+        graphs2idx = [edge_list_to_graph(edges) for edges in indexed_edges]
 
     print(f"{round(time() - start_time, 2)}s")
     return graphs2idx, idx2node
 
 
-def read_dynamic_graph(folder_path=None, limit=None, convert_to_idx=True):
+def _source_files(folder_path):
+    files = sorted(f for f in listdir(folder_path) if isfile(join(folder_path, f)))
+    return [{'name': f, 'size': os.path.getsize(join(folder_path, f)),
+             'mtime': os.path.getmtime(join(folder_path, f))} for f in files]
+
+
+def _save_array(filepath, array):
+    # Readers may memory-map the previous file: write a new file and move it in place
+    with open(filepath + ".tmp", 'wb') as fo:
+        np.save(fo, array)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def compile_dynamic_graph(folder_path, compiled_folder, workers=None):
+    '''
+    Compile the text edge lists of a dynamic graph into a binary store:
+        compiled_folder/manifest.json
+        compiled_folder/idx2node.npy
+        compiled_folder/graph_{i}_indptr.npy, graph_{i}_indices.npy, graph_{i}_data.npy (CSR of snapshot i)
+    The manifest is written last, so a store without manifest is incomplete.
+    :param folder_path: folder of the edge lists
+    :param compiled_folder:
+    :param workers: see read_edge_lists
+    :return: manifest
+    '''
     if folder_path is None or not exists(folder_path):
         raise ValueError("folder_path must be provided.")
+    if not exists(compiled_folder):
+        os.makedirs(compiled_folder)
+    manifest_path = join(compiled_folder, "manifest.json")
+    if exists(manifest_path):
+        os.remove(manifest_path)
+
+    source_files = _source_files(folder_path)
+    print(f"Compiling {len(source_files)} snapshots into {compiled_folder} ...", end=" ")
+    start_time = time()
+    edge_lists = read_edge_lists([join(folder_path, f['name']) for f in source_files], workers=workers)
+    idx2node, indexed_edges, node_sizes = index_edge_lists([edges for edges, _ in edge_lists])
+
+    _save_array(join(compiled_folder, "idx2node.npy"), idx2node)
+    nnz = []
+    for i, (edges, (_, weight), node_size) in enumerate(zip(indexed_edges, edge_lists, node_sizes)):
+        A = edge_list_to_csr(edges, weight, node_size=node_size)
+        for name in ['indptr', 'indices', 'data']:
+            _save_array(join(compiled_folder, f"graph_{i}_{name}.npy"), getattr(A, name))
+        nnz.append(int(A.nnz))
+
+    manifest = {
+        'source_folder': folder_path,
+        'source_files': source_files,
+        'weighted': [weight is not None for _, weight in edge_lists],
+        'node_sizes': [int(n) for n in node_sizes],
+        'nnz': nnz,
+    }
+    with open(manifest_path + ".tmp", 'w') as fo:
+        json.dump(manifest, fo, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    print(f"{round(time() - start_time, 2)}s")
+    return manifest
+
 
+def load_compiled_graph(compiled_folder, limit=None, mmap_mode='r'):
+    '''
+    Open a store of compile_dynamic_graph. Arrays are memory-mapped, so several processes share the page cache.
+    :param compiled_folder:
+    :param limit: maximum number of snapshots
+    :param mmap_mode: see np.load
+    :return: CSR snapshots, idx2node, manifest
+    '''
+    with open(join(compiled_folder, "manifest.json")) as fi:
+        manifest = json.load(fi)
+    idx2node = np.load(join(compiled_folder, "idx2node.npy"), mmap_mode=mmap_mode)
     graphs = []
+    for i, node_size in enumerate(manifest['node_sizes'][:limit]):
+        indptr, indices, data = (np.load(join(compiled_folder, f"graph_{i}_{name}.npy"), mmap_mode=mmap_mode)
+                                 for name in ['indptr', 'indices', 'data'])
+        graphs.append(sparse.csr_matrix((data, indices, indptr), shape=(node_size, node_size), copy=False))
+    return graphs, idx2node, manifest
+
+
+def _is_compiled(folder_path, compiled_folder):
+    manifest_path = join(compiled_folder, "manifest.json")
+    if not exists(manifest_path):
+        return False
+    with open(manifest_path) as fi:
+        manifest = json.load(fi)
+    return manifest['source_files'] == _source_files(folder_path)
+
+
+def _csr_to_edge_list(A):
+    coo = sparse.triu(A).tocoo()
+    return np.vstack((coo.row, coo.col)).T.astype(np.int64), coo.data
+
+
+def read_dynamic_graph(folder_path=None, limit=None, convert_to_idx=True, as_csr=False, workers=None,
+                       compiled_folder=None):
+    '''
+    Read the snapshots graph_XX.edgelist of a dynamic graph.
+    :param folder_path:
+    :param limit: maximum number of snapshots
+    :param convert_to_idx: re-index nodes to 0..N-1 (networkx output only; CSR output is always re-indexed)
+    :param as_csr: return CSR adjacency matrices instead of networkx graphs. Snapshot i has the shape of the number
+        of nodes seen up to snapshot i
+    :param workers: number of processes parsing the files, see read_edge_lists
+    :param compiled_folder: binary store of the dataset, see compile_dynamic_graph. It is compiled on first use (or
+        when the edge lists changed) and memory-mapped afterwards. Only as_csr=True returns the memory-mapped
+        matrices as they are. networkx graphs are still rebuilt edge by edge from them, which skips parsing the text
+        but takes O(|E|) python work per snapshot
+    :return: graphs (networkx graphs or CSR matrices), idx2node
+    '''
+    if folder_path is None or not exists(folder_path):
+        raise ValueError("folder_path must be provided.")
+
+    if compiled_folder is not None:
+        if not _is_compiled(folder_path, compiled_folder):
+            compile_dynamic_graph(folder_path, compiled_folder, workers=workers)
+        graphs, idx2node, manifest = load_compiled_graph(compiled_folder, limit=limit)
+        if as_csr:
+            return graphs, idx2node
+        edge_lists = [_csr_to_edge_list(A) for A in graphs]
+        if not convert_to_idx:
+            return [edge_list_to_graph(idx2node[edges], weight if weighted else None)
+                    for (edges, weight), weighted in zip(edge_lists, manifest['weighted'])], None
+        return [edge_list_to_graph(edges) for edges, _ in edge_lists], idx2node
+
     files = [f for f in listdir(folder_path) if isfile(join(folder_path, f))]
     files = sorted(files)
+    if limit is not None:
+        files = files[:limit]
+
+    print(f"Reading {len(files)} snapshots from {folder_path} ...", end=" ")
+    start_time = time()
+    edge_lists = read_edge_lists([join(folder_path, file) for file in files], workers=workers)
+    print(f"{round(time() - start_time, 2)}s")
 
-    for idx, file in enumerate(files):
-        if limit is not None and idx == limit:
-            break
-        print(f"[{idx}]Reading {file}")
-        G = get_graph_from_file(join(folder_path, file))
-        graphs.append(G)
+    if as_csr:
+        idx2node, indexed_edges, node_sizes = index_edge_lists([edges for edges, _ in edge_lists])
+        graphs = [
+            edge_list_to_csr(edges, weight, node_size=node_size)
+            for edges, (_, weight), node_size in zip(indexed_edges, edge_lists, node_sizes)
+        ]
+        return graphs, idx2node
 
     if not convert_to_idx:
-        return graphs, None
+        return [edge_list_to_graph(edges, weight) for edges, weight in edge_lists], None
 
-    return convert_graphs_to_idx(graphs)
+    idx2node, indexed_edges, _ = index_edge_lists([edges for edges, _ in edge_lists])
+    return [edge_list_to_graph(edges) for edges in indexed_edges], idx2node
 
 
 if __name__ == "__main__":
@@ -1,19 +1,41 @@
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from os import listdir
-from os.path import join, exists, isfile
+from os.path import join, exists
 from time import time
 
 import networkx as nx
 
 from src.static_ge import TStaticGE
+from src.utils import embedding_store
 from src.utils.autoencoder import TAutoencoder
 from src.utils.checkpoint_config import CheckpointConfig
-from src.utils.model_utils import get_hidden_layer, handle_expand_model, save_custom_model, load_custom_model
+from src.utils.model_utils import get_hidden_layer, handle_expand_model, load_custom_model, get_cpu_state_dict, \
+    save_model_state, load_checkpoint, create_model
+
+
+def _remove_checkpoint(ge: TStaticGE, filepath):
+    ge.wait_for_checkpoint()
+    if exists(filepath):
+        os.remove(filepath)
 
 
 class TDynGE(object):
-    def __init__(self, graphs, embedding_dim, l1=0.001, l2=0.0005, alpha=0.2, beta=10, activation='relu'):
+    def __init__(self, graphs, embedding_dim, l1=0.001, l2=0.0005, alpha=0.2, beta=10, activation='relu',
+                 embedding_cache_size=None):
+        '''
+
+        :param graphs:
+        :param embedding_dim:
+        :param l1:
+        :param l2:
+        :param alpha:
+        :param beta:
+        :param activation:
+        :param embedding_cache_size: maximum number of snapshot embeddings kept in memory, least recently used
+            first out. Default is no limit
+        '''
         super(TDynGE, self).__init__()
         if not graphs:
             raise ValueError("Must be provide graphs data")
@@ -27,38 +49,190 @@ class TDynGE(object):
         self.beta = beta
         self.static_ges = []
         self.activation = activation
+        self.embedding_cache_size = embedding_cache_size
+        # Snapshot indices with a memoized embedding, least recently used first
+        self._embedding_lru = OrderedDict()
+        # Folder of the models loaded by load_models. Snapshots not loaded yet are None in static_ges.
+        self._model_folder = None
+        # Models are persisted in background, one at a time, while the next snapshot trains
+        self._saving_executor = None
+        self._saving_futures = []
+
+    def _get_static_ge(self, index) -> TStaticGE:
+        '''
+        Static_ge of a snapshot. A snapshot of load_models that is not loaded yet is loaded now.
+        '''
+        ge = self.static_ges[index]
+        if ge is None:
+            if self._model_folder is None:
+                raise ValueError(f"Model of graph {index} is neither trained nor loaded.")
+            model = load_custom_model(filepath=join(self._model_folder, f"graph_{index}"))
+            ge = TStaticGE(G=self.graphs[index], model=model, alpha=self.alpha, beta=self.beta)
+            self.static_ges[index] = ge
+        return ge
+
+    def _is_in_memory(self, index):
+        return index < len(self.static_ges) and self.static_ges[index] is not None
+
+    def _get_saved_model_path(self, index, folder_path):
+        '''
+        Path (without extension) of the saved model of a snapshot in folder_path or in the folder of load_models,
+        None if there is no saved model
+        '''
+        for folder in [folder_path, self._model_folder]:
+            if folder is not None and exists(join(folder, f"graph_{index}.pt")):
+                return join(folder, f"graph_{index}")
+        return None
+
+    def _pad_static_ges(self, size, folder_path):
+        '''
+        Make static_ges hold at least size snapshots. The missing snapshots are None and loaded on first use from the
+        folder of load_models, or else from folder_path.
+        '''
+        if size <= len(self.static_ges):
+            return
+        if self._model_folder is None:
+            if folder_path is None:
+                raise ValueError(f"Models of graphs before {size} must be trained or loaded first.")
+            self._model_folder = folder_path
+        self.static_ges.extend([None] * (size - len(self.static_ges)))
+
+    def _set_static_ge(self, index, ge: TStaticGE):
+        if len(self.static_ges) == index:
+            self.static_ges.append(ge)
+        else:
+            self.static_ges[index] = ge
 
-    def get_all_embeddings(self):
-        return [ge.get_embedding() for ge in self.static_ges]
+    def _touch_embedding(self, index):
+        '''
+        Mark the memoized embedding of a snapshot as recently used and evict the least recently used ones over
+        embedding_cache_size.
+        '''
+        self._embedding_lru[index] = True
+        self._embedding_lru.move_to_end(index)
+        if self.embedding_cache_size is None:
+            return
+        while len(self._embedding_lru) > self.embedding_cache_size:
+            old_index, _ = self._embedding_lru.popitem(last=False)
+            ge = self.static_ges[old_index]
+            if ge is not None:
+                ge.embedding = None
+
+    def save_model_async(self, index, filepath):
+        '''
+        Persist the model of a snapshot (filepath.pt, filepath.json) in a background thread. The weights are copied
+        to CPU before returning, so training can go on.
+        :param index:
+        :param filepath:
+        :return:
+        '''
+        model: TAutoencoder = self._get_static_ge(index).get_model()
+        state_dict = get_cpu_state_dict(model)
+        config_layer = deepcopy(model.get_config_layer())
+        self._submit_saving(save_model_state, state_dict, config_layer, filepath)
+
+    def _submit_saving(self, fn, *args):
+        '''
+        Run fn(*args) in the saving thread, after the saves queued before
+        '''
+        if self._saving_executor is None:
+            self._saving_executor = ThreadPoolExecutor(max_workers=1)
+        self._saving_futures.append(self._saving_executor.submit(fn, *args))
+
+    def wait_for_saving(self):
+        '''
+        Block until every model queued by save_model_async is on disk and the checkpoints of the trained snapshots are
+        removed. Re-raise the error of a failed save.
+        '''
+        futures, self._saving_futures = self._saving_futures, []
+        for future in futures:
+            future.result()
+
+    def get_all_embeddings(self, chunk_size=1024, folder_path=None):
+        '''
+        Encode every snapshot by chunks of adjacency rows.
+        :param chunk_size: number of rows encoded at once
+        :param folder_path: if provided, embeddings are written to the embedding store folder_path and returned
+            memory-mapped
+        :return:
+        '''
+        if folder_path is not None and not exists(folder_path):
+            os.makedirs(folder_path)
+        return [self.get_embedding(index=i, chunk_size=chunk_size, folder_path=folder_path)
+                for i in range(len(self.static_ges))]
 
-    def get_embedding(self, index):
+    def get_embedding(self, index, chunk_size=1024, folder_path=None):
+        '''
+        Embedding of a snapshot. It is memoized until the snapshot is trained again.
+        '''
         if index < 0 or index >= self.size:
             raise ValueError("index is invalid!")
-        return self.static_ges[index].get_embedding()
+        ge: TStaticGE = self._get_static_ge(index)
+        if folder_path is None:
+            embedding = ge.get_embedding(chunk_size=chunk_size)
+        elif embedding_store.is_saved(folder_path, index, ge.embedding_fingerprint):
+            # The embedding of the current weights is already in the store (even if evicted from memory)
+            embedding = ge.load_embedding(folder_path, index)
+        else:
+            tmp_path = embedding_store.get_tmp_embedding_path(folder_path, index)
+            ge.get_embedding(chunk_size=chunk_size, filepath=tmp_path)
+            embedding_store.commit_embedding_file(folder_path, index, tmp_path, fingerprint=ge.embedding_fingerprint)
+            embedding = ge.load_embedding(folder_path, index)
+        self._touch_embedding(index)
+        return embedding
+
+    def get_all_reconstructions(self, threshold=None, top_k=None, chunk_size=1024):
+        '''
+        Reconstruction of every snapshot. With threshold or top_k, each reconstruction is a sparse csr matrix.
+        '''
+        return [self._get_static_ge(i).get_reconstruction(threshold=threshold, top_k=top_k, chunk_size=chunk_size)
+                for i in range(len(self.static_ges))]
 
-    def get_all_reconstructions(self):
-        ge: TStaticGE
-        return [ge.get_reconstruction() for ge in self.static_ges]
+    def evaluate_losses(self, index=None, chunk_size=1024, workers=None):
+        '''
+        Loss of the snapshots without training, see TStaticGE.evaluate_loss.
+        :param index: snapshot index or list of indices. Default is every snapshot
+        :param chunk_size:
+        :param workers: number of snapshots evaluated in parallel threads. Default is one at a time
+        :return: list of {'loss_1', 'loss_2', 'loss'}
+        '''
+        if index is None:
+            index = range(len(self.static_ges))
+        elif isinstance(index, int):
+            index = [index]
+        static_ges = [self._get_static_ge(i) for i in index]
+        if workers is None or workers <= 1:
+            return [ge.evaluate_loss(chunk_size=chunk_size) for ge in static_ges]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda ge: ge.evaluate_loss(chunk_size=chunk_size), static_ges))
 
     def _train_model(self, dy_ge_idx, filepath, batch_size, epochs,
                      skip_print, learning_rate, early_stop,
-                     plot_loss=True, ck_config: CheckpointConfig = None, shuffle=False):
-        ge: TStaticGE = self.static_ges[dy_ge_idx]
+                     plot_loss=True, ck_config: CheckpointConfig = None, shuffle=False, lazy_update=False,
+                     lr_schedule='piecewise', checkpoint=None):
+        ge: TStaticGE = self._get_static_ge(dy_ge_idx)
 
         start_time = time()
         ge.train(batch_size=batch_size, epochs=epochs, skip_print=skip_print, learning_rate=learning_rate,
-                 ck_config=ck_config, early_stop=early_stop, plot_loss=plot_loss, shuffle=shuffle)
+                 ck_config=ck_config, early_stop=early_stop, plot_loss=plot_loss, shuffle=shuffle,
+                 lazy_update=lazy_update, lr_schedule=lr_schedule, checkpoint=checkpoint)
         training_time = time() - start_time
-
-        save_custom_model(model=ge.get_model(), filepath=filepath)
+        # ge.train dropped the memoized embedding
+        self._embedding_lru.pop(dy_ge_idx, None)
 
         # Make sure saving the updated static_ge
         self.static_ges[dy_ge_idx] = ge
+        if filepath is not None:
+            self.save_model_async(index=dy_ge_idx, filepath=filepath)
+        if ck_config is not None:
+            # Once the model is saved, the checkpoint of the finished training must not be resumed
+            self._submit_saving(_remove_checkpoint, ge, ck_config.get_filepath())
         return round(training_time, 2)
 
     def _create_static_ge(self, index, folder_path, prop_size, net2net_applied):
         '''
-            Static_ge is always create new weight for index = 0 and expand model for other index >0
+            Static_ge is always create new weight for index = 0 and expand model for other index >0.
+            The previous model is copied from memory, or loaded from folder_path if it is not in memory.
         :param index:
         :param folder_path:
         :param prop_size:
@@ -88,33 +262,42 @@ class TDynGE(object):
                 activation=self.activation
             )
         else:
-            prev_ae = load_custom_model(filepath=join(folder_path, f"graph_{index - 1}"))
+            if index - 1 < len(self.static_ges) and (self.static_ges[index - 1] is not None or
+                                                     self._model_folder is not None):
+                prev_ae = deepcopy(self._get_static_ge(index - 1).get_model())
+            else:
+                if folder_path is None:
+                    raise ValueError(f"Model of graph {index - 1} is neither trained nor loaded.")
+                self.wait_for_saving()
+                prev_ae = load_custom_model(filepath=join(folder_path, f"graph_{index - 1}"))
             autoencoder = handle_expand_model(model=prev_ae, input_dim=input_dim,
                                               prop_size=prop_size, net2net_applied=net2net_applied)
 
         ge = TStaticGE(G=g, model=autoencoder, alpha=self.alpha, beta=self.beta)
         return ge
 
-    def train(self, folder_path, prop_size=0.3, batch_size=64, epochs=100, skip_print=5,
+    def train(self, folder_path=None, prop_size=0.3, batch_size=64, epochs=100, skip_print=5,
               net2net_applied=False, learning_rate=1e-6, ck_config: CheckpointConfig = None,
-              early_stop=50, plot_loss=True, shuffle=False):
+              early_stop=50, plot_loss=True, shuffle=False, lazy_update=False, lr_schedule='piecewise'):
         '''
-
-        :param folder_path:
+        Train every snapshot. The model of snapshot i is expanded from the trained model of snapshot i - 1 in memory.
+        :param folder_path: if provided, each trained model is saved there in background
         :param prop_size:
         :param batch_size:
         :param epochs:
         :param skip_print:
         :param net2net_applied:
-        :param learning_rate:
+        :param learning_rate: learning rate or list of learning rates, see TStaticGE.train
         :param ck_config:
         :param early_stop:
         :param plot_loss:
         :param shuffle:
+        :param lazy_update: update only the columns of the N-wide input layer touched by each batch
+        :param lr_schedule: 'piecewise' | 'decay', used when learning_rate is a list (see TStaticGE.train)
         :return:
         '''
         # Create folder for saving model if not existed
-        if not exists(folder_path):
+        if folder_path is not None and not exists(folder_path):
             os.makedirs(folder_path)
 
         training_time_sum = 0
@@ -123,100 +306,130 @@ class TDynGE(object):
                                           batch_size=batch_size, epochs=epochs, skip_print=skip_print,
                                           net2net_applied=net2net_applied, learning_rate=learning_rate,
                                           ck_config=ck_config, early_stop=early_stop, plot_loss=plot_loss,
-                                          is_load_from_previous_model=True, shuffle=shuffle, call_in_class=True
-                                          )
+                                          is_load_from_previous_model=True, shuffle=shuffle,
+                                          lazy_update=lazy_update, lr_schedule=lr_schedule)
             training_time_sum += training_time
             # print(f"Training time in {training_time}s")
+        self.wait_for_saving()
         return training_time_sum
 
     def train_at(self, model_index, folder_path, prop_size=0.4, batch_size=64, epochs=100, skip_print=5,
                  net2net_applied=False, learning_rate=0.001, ck_config: CheckpointConfig = None,
-                 early_stop=50, plot_loss=True, is_load_from_previous_model=False, shuffle=False, call_in_class=False):
+                 early_stop=50, plot_loss=True, is_load_from_previous_model=False, shuffle=False,
+                 lazy_update=False, lr_schedule='piecewise'):
         '''
         To training a specific model.
-        :param call_in_class:
         :param shuffle:
         :param model_index:
-        :param folder_path:
+        :param folder_path: folder of the saved models. If provided, the trained model is saved there in background
+            (see wait_for_saving)
         :param prop_size:
         :param batch_size:
         :param epochs:
         :param skip_print:
         :param net2net_applied:
-        :param learning_rate:
-        :param ck_config:
+        :param learning_rate: learning rate or list of learning rates, see TStaticGE.train
+        :param ck_config: periodic checkpoints of the training state, see TStaticGE.train
         :param early_stop:
         :param plot_loss:
         :param is_load_from_previous_model: for training new weight from previous model.
-                If NOT, model will continue (resume) training
+                If NOT, model will continue (resume) training: from the latest checkpoint of ck_config if training
+                of this snapshot was interrupted, else from the model in memory or saved in folder_path. A snapshot
+                with none of them is trained from the previous model. Only the models needed are loaded.
+        :param lazy_update: update only the columns of the N-wide input layer touched by each batch
+        :param lr_schedule: 'piecewise' | 'decay', used when learning_rate is a list (see TStaticGE.train)
         :return:
         '''
-        if not exists(folder_path):
-            raise ValueError(f"{folder_path} is invalid path.")
-        if not call_in_class:
-            if len(self.static_ges) == 0:
-                self.load_models(folder_path=folder_path)
-            if model_index >= len(self.static_ges):
-                raise ValueError(f"{model_index} is out of range")
-
-        if is_load_from_previous_model:  # for begin training -> create new model to train
-            ge = self._create_static_ge(index=model_index, folder_path=folder_path,
-                                        prop_size=prop_size,
-                                        net2net_applied=net2net_applied)
-            if call_in_class and len(self.static_ges) == model_index:
-                self.static_ges.append(ge)
-            else:
-                self.static_ges[model_index] = ge
+        if folder_path is not None and not exists(folder_path):
+            os.makedirs(folder_path)
 
-        # Else for resume training
         updated_ck_config = deepcopy(ck_config)
         if updated_ck_config is not None:
             updated_ck_config.set_index(index=model_index)
 
+        checkpoint = None
+        if not is_load_from_previous_model and updated_ck_config is not None:
+            checkpoint = load_checkpoint(updated_ck_config.get_filepath())
+
+        saved_model_path = None
+        if not is_load_from_previous_model and checkpoint is None and not self._is_in_memory(model_index):
+            saved_model_path = self._get_saved_model_path(model_index, folder_path)
+
+        if checkpoint is not None:  # for interrupted training -> continue from the checkpoint
+            self._pad_static_ges(model_index, folder_path)
+            ge = TStaticGE(G=self.graphs[model_index], model=create_model(checkpoint['config_layer']),
+                           alpha=self.alpha, beta=self.beta)
+            self._set_static_ge(model_index, ge)
+        elif not is_load_from_previous_model and self._is_in_memory(model_index):
+            pass  # for resume training of the model in memory
+        elif saved_model_path is not None:  # for resume training -> continue from the saved model
+            self._pad_static_ges(model_index, folder_path)
+            self.wait_for_saving()
+            ge = TStaticGE(G=self.graphs[model_index], model=load_custom_model(filepath=saved_model_path),
+                           alpha=self.alpha, beta=self.beta)
+            self._set_static_ge(model_index, ge)
+        else:  # for begin training, or resume of a snapshot never trained -> create new model to train
+            if not is_load_from_previous_model:
+                self._pad_static_ges(model_index, folder_path)
+            if model_index > len(self.static_ges):
+                raise ValueError(f"Models of graphs before {model_index} must be trained or loaded first.")
+            ge = self._create_static_ge(index=model_index, folder_path=folder_path,
+                                        prop_size=prop_size,
+                                        net2net_applied=net2net_applied)
+            self._set_static_ge(model_index, ge)
+
         print(f"\t--- Graph {model_index} ---")
-        training_time = self._train_model(dy_ge_idx=model_index, filepath=join(folder_path, f"graph_{model_index}"),
+        filepath = join(folder_path, f"graph_{model_index}") if folder_path is not None else None
+        training_time = self._train_model(dy_ge_idx=model_index, filepath=filepath,
                                           batch_size=batch_size, epochs=epochs, learning_rate=learning_rate,
                                           skip_print=skip_print, early_stop=early_stop, plot_loss=plot_loss,
-                                          ck_config=updated_ck_config, shuffle=shuffle)
+                                          ck_config=updated_ck_config, shuffle=shuffle, lazy_update=lazy_update,
+                                          lr_schedule=lr_schedule, checkpoint=checkpoint)
         # print(f"Time in {training_time}s")
         return training_time
 
-    def load_models(self, folder_path):
+    def load_models(self, folder_path, index=None):
+        '''
+        Load the saved models of the snapshots.
+        :param folder_path:
+        :param index: snapshot index or list of indices to load now. Default is every snapshot. The other snapshots
+            are loaded on first use.
+        :return:
+        '''
+        self.wait_for_saving()
         print("Loading models...", end=" ")
         start_time = time()
-        self.static_ges = []
-
-        # Trick for get length of saved models
-        files = [f for f in listdir(folder_path) if isfile(join(folder_path, f))]
-        length = len(files) // 2
 
-        if length != len(self.graphs):
-            raise Exception("There are NO saved training data")
-
-        for i in range(length):
-            filepath = join(folder_path, f"graph_{i}")
-            model = load_custom_model(filepath=filepath)
-
-            ge = TStaticGE(G=self.graphs[i], model=model, alpha=self.alpha, beta=self.beta)
-            self.static_ges.append(ge)
+        for i in range(len(self.graphs)):
+            if not exists(join(folder_path, f"graph_{i}.pt")):
+                raise Exception("There are NO saved training data")
+
+        self._model_folder = folder_path
+        self.static_ges = [None] * len(self.graphs)
+        if index is None:
+            index = range(len(self.graphs))
+        elif isinstance(index, int):
+            index = [index]
+        for i in index:
+            self._get_static_ge(i)
         print(f"{round(time() - start_time, 2)}s")
 
     def save_embeddings(self, folder_path):
         print("Saving embeddings...")
         if not exists(folder_path):
             os.makedirs(folder_path)
-        for idx, ge in enumerate(self.static_ges):
-            ge: TStaticGE
-            ge.save_embedding(filepath=join(folder_path, f"_{idx}"))
+        for idx in range(len(self.static_ges)):
+            self._get_static_ge(idx).save_embedding(folder_path=folder_path, index=idx)
+            self._touch_embedding(idx)
 
     def load_embeddings(self, folder_path):
         if not exists(folder_path):
             raise ValueError("Folder is invalid.")
 
         embeddings = []
-        for idx, ge in enumerate(self.static_ges):
-            ge: TStaticGE
-            embedding = ge.load_embedding(filepath=join(folder_path, f"_{idx}"))
+        for idx in range(len(self.static_ges)):
+            embedding = self._get_static_ge(idx).load_embedding(folder_path=folder_path, index=idx)
+            self._touch_embedding(idx)
             embeddings.append(embedding)
         return embeddings
 
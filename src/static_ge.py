@@ -1,27 +1,54 @@
-import pickle
-from os.path import join
+import os
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 import networkx as nx
 import numpy as np
 import scipy.sparse as sparse
 import torch
 from node2vec import Node2Vec
-from torch.autograd import Variable
-from torch.utils.data import DataLoader
 
-from src.data_preprocessing.graph_dataset import GraphDataset
-from src.data_preprocessing.graph_preprocessing import next_datasets, get_graph_from_file, handle_graph_mini_batch
+from src.data_preprocessing.graph_preprocessing import next_datasets, get_graph_from_file, \
+    convert_sparse_matrix_to_sparse_tensor, get_edge_index
+from src.utils import embedding_store
 from src.utils.autoencoder import TAutoencoder
 from src.utils.checkpoint_config import CheckpointConfig
 from src.utils.evaluate import reconstruction_mse, reconstruction_accuracy
 from src.utils.graph_util import draw_graph, print_graph_stats
+from src.utils.lazy_adam import LazyAdam
+from src.utils.losses import first_order_loss, second_order_loss
 from src.utils.precision_k_evaluate import check_link_predictionK, reconstruction_precision_k
 from src.utils.link_prediction import preprocessing_graph_for_link_prediction, run_link_pred_evaluate
-from src.utils.model_utils import save_custom_model
+from src.utils.model_utils import get_cpu_state_dict, to_cpu, save_checkpoint
 from src.utils.visualize import plot_reconstruct_graph, plot_embeddings_with_labels, plot_losses
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# graph -> {'fingerprint', 'A'}. Entries are dropped with their graph.
+_graph_matrices_cache = weakref.WeakKeyDictionary()
+
+
+def invalidate_graph_matrices(G: nx.Graph):
+    '''
+    Drop the cached adjacency matrix of G. Must be called after editing G in place when the number of nodes and
+    edges stays the same (e.g. rewiring or re-weighting edges); other edits are detected.
+    '''
+    _graph_matrices_cache.pop(G, None)
+
+
+def _get_rng_state():
+    # The numpy state is stored as tensor and python values, so the checkpoint loads with torch.load only
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {'torch': torch.get_rng_state(), 'numpy': [torch.from_numpy(keys.astype(np.int64)), int(pos),
+                                                      int(has_gauss), float(cached_gaussian)]}
+
+
+def _set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state(('MT19937', keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian))
+
 
 class TStaticGE(object):
     def __init__(self, G: nx.Graph, embedding_dim=None, hidden_dims=None, model: TAutoencoder = None,
@@ -57,152 +84,426 @@ class TStaticGE(object):
             self.l1 = config_layer['l1']
             self.l2 = config_layer['l2']
 
-        self.A: sparse.csr_matrix
-        self.L: sparse.csr_matrix
-        self.A, self.L = self._create_A_L_matrix()
         self.embedding = None
+        # Identifier of the memoized embedding, recorded in the embedding store manifest
+        self.embedding_fingerprint = None
+        # Last checkpoint of train, possibly still being written
+        self._checkpoint_future = None
 
-    def _create_A_L_matrix(self):
-        A = nx.to_scipy_sparse_matrix(self.G, format='csr').astype(np.float32)
-        D = sparse.diags(A.sum(axis=1).flatten().tolist()[0]).astype(np.float32)
-        L = D - A
-        return A, L
-
-    def _compute_loss(self, x, x_hat, y, L):
-        def loss_1st(Y, L):
-            Y_ = torch.matmul(torch.transpose(Y, 0, 1), L)
-            return 2 * torch.trace(torch.matmul(Y_, Y))
+    def _get_graph_matrices(self):
+        '''
+        Cached matrices of self.G, shared by every TStaticGE of the same graph. The cache entry is rebuilt when the
+        graph fingerprint (number of nodes, number of edges) changes, or after invalidate_graph_matrices.
+        '''
+        fingerprint = (self.G.number_of_nodes(), self.G.number_of_edges())
+        matrices = _graph_matrices_cache.get(self.G)
+        if matrices is None or matrices['fingerprint'] != fingerprint:
+            matrices = {'fingerprint': fingerprint}
+            _graph_matrices_cache[self.G] = matrices
+        return matrices
+
+    @property
+    def A(self) -> sparse.csr_matrix:
+        '''
+        Adjacency matrix of the graph, built on first use
+        '''
+        matrices = self._get_graph_matrices()
+        if 'A' not in matrices:
+            matrices['A'] = self._create_A_matrix()
+        return matrices['A']
 
-        def loss_2nd(X_hat, X, beta):
-            B = torch.ones_like(X).to(device)
-            B[X != 0] = beta
-            return torch.sum(torch.square((X_hat - X) * B))
+    def _create_A_matrix(self):
+        A = nx.to_scipy_sparse_matrix(self.G, format='csr').astype(np.float32)
+        A.eliminate_zeros()
+        return A
 
-        batch_size = x.shape[0]
+    def _compute_loss(self, x_index, x_value, x_hat, y, edge_index, edge_weight):
         # TODO: check if divide batch_size
-        loss_1 = loss_1st(y, L)
-        loss_2 = loss_2nd(x_hat, x, self.beta)
+        loss_1 = first_order_loss(y, edge_index, edge_weight)
+        loss_2 = second_order_loss(x_hat, x_index, x_value, self.beta)
         loss = loss_2 + self.alpha * loss_1
         return loss
 
+    @staticmethod
+    def _to_batch_tensors(batch_inp):
+        '''
+        Convert a batch of next_datasets to tensors on device
+        :param batch_inp: [A_train, edge_index, edge_weight]
+        :return: x, x_index, x_value, edge_index, edge_weight
+        '''
+        A_train, edge_index, edge_weight = batch_inp
+        x = convert_sparse_matrix_to_sparse_tensor(A_train).to(device)
+        return x, x.indices(), x.values(), torch.tensor(edge_index).to(device), torch.tensor(edge_weight).to(device)
+
+    def _to_input_tensor(self, x=None):
+        '''
+        Input of the model. Sparse inputs (the adjacency matrix by default) stay sparse.
+        :param x: None | scipy sparse matrix | numpy array | tensor
+        :return:
+        '''
+        if x is None:
+            x = self.A
+        if sparse.issparse(x):
+            x = convert_sparse_matrix_to_sparse_tensor(x)
+        elif not torch.is_tensor(x):
+            x = torch.tensor(x)
+        return x.to(device)
+
+    @staticmethod
+    def _get_learning_rate(learning_rates, phase, phase_epoch, epochs, lr_schedule):
+        '''
+        Learning rate of an epoch of a phase. 'piecewise': constant learning_rates[phase]. 'decay': geometric decay
+        from learning_rates[phase] to learning_rates[phase + 1] over the phase (the last phase is constant).
+        '''
+        lr = learning_rates[phase]
+        if lr_schedule == 'decay' and phase + 1 < len(learning_rates):
+            lr = lr * (learning_rates[phase + 1] / lr) ** (phase_epoch / epochs)
+        return lr
+
     def train(self, batch_size=None, epochs=1, learning_rate=1e-6, skip_print=1, ck_config: CheckpointConfig = None,
-              early_stop=None, threshold_loss=1e-4, plot_loss=True, shuffle=False):
+              early_stop=None, threshold_loss=1e-4, plot_loss=True, shuffle=False, lazy_update=False,
+              lr_schedule='piecewise', checkpoint=None):
+        '''
+
+        :param batch_size: number of nodes per batch. None for training the whole graph in one batch
+        :param epochs: number of epochs of each learning rate phase
+        :param learning_rate: learning rate, or list of learning rates trained one phase after another with the same
+            optimizer (moment estimates are kept between phases)
+        :param skip_print:
+        :param ck_config: if provided, checkpoints of the training state (weights, optimizer moments, epoch,
+            early-stop counters, loss history, random states) are saved periodically to ck_config.get_filepath() in a
+            background thread. The last one may still be written when train returns, see wait_for_checkpoint
+        :param early_stop: number of epochs without improvement which ends the current phase
+        :param threshold_loss:
+        :param plot_loss:
+        :param shuffle:
+        :param lazy_update: use LazyAdam, which updates only the columns of the N-wide input layer touched by the
+            non-zero entries of the batch
+        :param lr_schedule: 'piecewise' | 'decay', see _get_learning_rate
+        :param checkpoint: checkpoint saved by a previous call (see model_utils.load_checkpoint). Training resumes
+            right after the checkpointed epoch
+        :return:
+        '''
+        if lr_schedule not in ['piecewise', 'decay']:
+            raise ValueError(f"lr_schedule={lr_schedule} is invalid. Must be 'piecewise' or 'decay'.")
+        if checkpoint is not None and checkpoint['lazy_update'] != lazy_update:
+            raise ValueError(f"Checkpoint was trained with lazy_update={checkpoint['lazy_update']}.")
+        learning_rates = [learning_rate] if np.isscalar(learning_rate) else list(learning_rate)
+
+        # Checkpoints of a previous call must not be written over the new ones
+        self.wait_for_checkpoint()
         # TODO: set seed through parameter
         torch.manual_seed(6)
-        # graph_dataset = GraphDataset(A=self.A, L=self.L, batch_size=batch_size)
-        # dataloader = DataLoader(graph_dataset)
-        graph_dataset = GraphDataset(A=self.A, L=self.L)
+        # Weights change: the memoized embedding is stale
+        self.embedding = None
+        self.embedding_fingerprint = None
         if batch_size is None:
             batch_size = self.input_dim
 
-        # Train whole dataset in one batch_size
-        ## dataloader = DataLoader(graph_dataset, batch_size=batch_size, shuffle=shuffle, pin_memory=True)
-        A = torch.tensor(self.A.todense())
-        L = torch.tensor(self.L.todense())
+        # A stays in csr format and each mini-batch is fed to the model as a sparse tensor. A single full batch
+        # is converted once and reused for every epoch.
+        full_batch = None
+        if batch_size >= self.input_dim:
+            full_batch = [(step, self._to_batch_tensors(batch_inp))
+                          for step, batch_inp in next_datasets(self.A, batch_size=batch_size)]
 
         self.model = self.model.to(device)
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=learning_rate, weight_decay=self.l2)
+        if lazy_update:
+            optimizer = LazyAdam(self.model.get_param_groups(), lr=learning_rates[0], weight_decay=self.l2)
+        else:
+            optimizer = torch.optim.Adam(self.model.parameters(), lr=learning_rates[0], weight_decay=self.l2)
 
-        min_loss = 1e6
-        count_epoch_no_improves = 0
+        total_epochs = epochs * len(learning_rates)
+        epoch = 0
         train_losses = []
         is_stop_train = False
+        start_phase, start_phase_epoch = 0, 0
+        if checkpoint is not None:
+            self.model.load_state_dict(checkpoint['model_state'])
+            optimizer.load_state_dict(checkpoint['optimizer_state'])
+            _set_rng_state(checkpoint['rng_state'])
+            epoch = checkpoint['epoch']
+            train_losses = list(checkpoint['train_losses'])
+            start_phase, start_phase_epoch = checkpoint['phase'], checkpoint['phase_epoch']
+            print(f"\tResume from epoch {epoch}")
+
+        # Checkpoints are written by one background thread from a CPU copy of the state, while training goes on
+        ck_executor = None
+        ck_future = None
+        ck_time = time()
+
+        def _save_checkpoint_async(next_phase, next_phase_epoch):
+            nonlocal ck_executor, ck_future, ck_time
+            state = {
+                'config_layer': self.model.get_config_layer(),
+                'model_state': get_cpu_state_dict(self.model),
+                'optimizer_state': to_cpu(optimizer.state_dict()),
+                'lazy_update': lazy_update,
+                'rng_state': _get_rng_state(),
+                'epoch': epoch,
+                'phase': next_phase,
+                'phase_epoch': next_phase_epoch,
+                'min_loss': min_loss,
+                'count_epoch_no_improves': count_epoch_no_improves,
+                'train_losses': list(train_losses)
+            }
+            if ck_executor is None:
+                ck_executor = ThreadPoolExecutor(max_workers=1)
+            # At most one checkpoint in flight. A failed save is raised here.
+            if ck_future is not None:
+                ck_future.result()
+            ck_future = ck_executor.submit(save_checkpoint, state, ck_config.get_filepath())
+            self._checkpoint_future = ck_future
+            ck_time = time()
+
+        min_loss = 1e6
+        count_epoch_no_improves = 0
+        for phase in range(start_phase, len(learning_rates)):
+            if len(learning_rates) > 1:
+                print(f"\tLearning rate = {learning_rates[phase]}")
+            min_loss = 1e6
+            count_epoch_no_improves = 0
+            first_phase_epoch = 0
+            if checkpoint is not None and phase == start_phase and start_phase_epoch > 0:
+                min_loss = checkpoint['min_loss']
+                count_epoch_no_improves = checkpoint['count_epoch_no_improves']
+                first_phase_epoch = start_phase_epoch
+
+            for phase_epoch in range(first_phase_epoch, epochs):
+                t1 = time()
+                lr = self._get_learning_rate(learning_rates, phase, phase_epoch, epochs, lr_schedule)
+                for param_group in optimizer.param_groups:
+                    param_group['lr'] = lr
+
+                epoch_loss = 0
+                if full_batch is not None:
+                    dataloader = full_batch
+                else:
+                    dataloader = next_datasets(self.A, batch_size=batch_size, shuffle=shuffle)
+
+                for step, batch_inp in dataloader:
+                    if full_batch is None:
+                        batch_inp = self._to_batch_tensors(batch_inp)
+                    x, x_index, x_value, edge_index, edge_weight = batch_inp
+
+                    # ===================forward=====================
+                    optimizer.zero_grad()
+
+                    x_hat, y = self.model(x)
+                    loss = self._compute_loss(x_index, x_value, x_hat, y, edge_index, edge_weight)
+
+                    if loss < 0:
+                        is_stop_train = True
+                        print("Stopping training due to negative loss.")
+                        break
+
+                    # ===================backward====================
+                    loss.backward()
+                    if lazy_update:
+                        optimizer.step(index=torch.unique(x_index[1]))
+                    else:
+                        optimizer.step()
+                    epoch_loss += loss.item()
+
+                    del batch_inp, x, x_index, x_value, edge_index, edge_weight, x_hat, y, loss
+
+                if is_stop_train:
+                    break
+
+                # ===================log========================
+                train_losses.append(round(float(epoch_loss), 4))
+                if (epoch + 1) % skip_print == 0 or phase_epoch == epochs - 1 or epoch == 0:
+                    print('Epoch [{}/{}] \t\tloss:{:.4f} \t\ttime:{:.2f}s'.format(epoch + 1, total_epochs, epoch_loss,
+                                                                                 time() - t1))
+
+                epoch += 1
+
+                if epoch_loss < min_loss - threshold_loss:
+                    count_epoch_no_improves = 0
+                    min_loss = epoch_loss
+                else:
+                    count_epoch_no_improves += 1
+
+                is_early_stop = early_stop is not None and count_epoch_no_improves == early_stop
+                if ck_config is not None and ck_config.is_due(epoch, time() - ck_time):
+                    if is_early_stop or phase_epoch == epochs - 1:
+                        _save_checkpoint_async(next_phase=phase + 1, next_phase_epoch=0)
+                    else:
+                        _save_checkpoint_async(next_phase=phase, next_phase_epoch=phase_epoch + 1)
+
+                if is_early_stop:
+                    print('Early stopping!\t Epoch [{}/{}], loss:{:.4f}'.format(epoch, total_epochs, epoch_loss))
+                    break
+
+                torch.cuda.empty_cache()
 
-        x = Variable(A).to(device)
-        L = L.to(device)
-        for epoch in range(epochs):
-            # for data in dataloader:
-            t1 = time()
-            epoch_loss = 0
             if is_stop_train:
                 break
-            # for step, batch_inp in enumerate(dataloader):
 
-            # A, L = handle_graph_mini_batch(batch_inp)
+        if ck_executor is not None:
+            # The last checkpoint is finished in background
+            ck_executor.shutdown(wait=False)
 
-            # ===================forward=====================
-            optimizer.zero_grad()
+        if plot_loss:
+            lr_title = ",".join(str(lr) for lr in learning_rates)
+            plot_losses(losses=train_losses, x_label="epoch", y_label="loss",
+                        title=f"emb_dim={self.embedding_dim}|lr={lr_title}|alpha={self.alpha}|beta={self.beta}")
 
-            x_hat, y = self.model(x)
-            loss = self._compute_loss(x, x_hat, y, L)
-            epoch_loss += loss
+        del full_batch
 
-            if loss < 0:
-                is_stop_train = True
-                print("Stopping training due to negative loss.")
-                break
+    def wait_for_checkpoint(self):
+        '''
+        Block until the last checkpoint of train is on disk. Re-raise the error of a failed save.
+        '''
+        future, self._checkpoint_future = self._checkpoint_future, None
+        if future is not None:
+            future.result()
 
-            # ===================backward====================
-            loss.backward()
-            optimizer.step()
+    def evaluate_loss(self, chunk_size=1024):
+        '''
+        Loss of the whole graph under torch.no_grad(). The weights are not changed. The adjacency matrix is fed by
+        chunks of rows, so peak memory is bounded by chunk_size x N.
+        :param chunk_size: number of rows evaluated at once
+        :return: {'loss_1': first-order loss, 'loss_2': second-order loss, 'loss': loss_2 + alpha * loss_1}
+        '''
+        A = self.A
+        model = self.model.to(device)
+        Y = torch.empty((A.shape[0], self.embedding_dim), device=device)
+        loss_2 = 0.
+        with torch.no_grad():
+            for start in range(0, A.shape[0], chunk_size):
+                x = self._to_input_tensor(A[start:start + chunk_size])
+                x_hat, y = model(x)
+                loss_2 += second_order_loss(x_hat, x.indices(), x.values(), self.beta).item()
+                Y[start:start + chunk_size] = y
+                del x, x_hat, y
+
+            edge_index, edge_weight = get_edge_index(A)
+            loss_1 = 0.
+            for start in range(0, edge_index.shape[1], chunk_size * 64):
+                loss_1 += first_order_loss(Y, torch.tensor(edge_index[:, start:start + chunk_size * 64]).to(device),
+                                           torch.tensor(edge_weight[start:start + chunk_size * 64]).to(device)).item()
+        del Y
+        torch.cuda.empty_cache()
+        return {'loss_1': loss_1, 'loss_2': loss_2, 'loss': loss_2 + self.alpha * loss_1}
 
-            # del x
-            # del L
-            # ===================log========================
-            train_losses.append(round(float(epoch_loss), 4))
-            if (epoch + 1) % skip_print == 0 or epoch == epochs - 1 or epoch == 0:
-                print(
-                    'Epoch [{}/{}] \t\tloss:{:.4f} \t\ttime:{:.2f}s'.format(epoch + 1, epochs, epoch_loss, time() - t1))
+    def get_embedding(self, x=None, chunk_size=1024, filepath=None):
+        '''
 
-            if ck_config is not None and ck_config.NumberSaved == epoch:
-                save_custom_model(model=self.model, filepath=join(ck_config.FolderPath, f"graph_{ck_config.Index}"))
+        :param x: graph input. Must have same dimension with the original graph. Can be a scipy sparse matrix.
+            Default is the adjacency matrix of the graph.
+        :param chunk_size: number of rows encoded at once for a sparse input. Peak memory is bounded by chunk_size
+            instead of the number of nodes.
+        :param filepath: if provided, the embedding is written to this memory-mapped .npy file
+        :return: float32 array with shape (number of rows of x, embedding_dim)
+        '''
+        # The embedding of the graph is memoized until the next training
+        is_graph_input = x is None
+        if is_graph_input and self.embedding is not None:
+            if filepath is not None and getattr(self.embedding, 'filename', None) != os.path.abspath(filepath):
+                np.save(filepath, self.embedding)
+                self.embedding = np.load(filepath, mmap_mode='r')
+            return self.embedding
 
-            if epoch_loss < min_loss - threshold_loss:
-                count_epoch_no_improves = 0
-                min_loss = epoch_loss
+        if x is None:
+            x = self.A
+        model = self.model.to(device)
+
+        if sparse.issparse(x):
+            x = x.tocsr()
+            shape = (x.shape[0], self.embedding_dim)
+            if filepath is None:
+                embedding = np.empty(shape, dtype=np.float32)
             else:
-                count_epoch_no_improves += 1
-
-            if early_stop is not None and count_epoch_no_improves == early_stop:
-                print('Early stopping!\t Epoch [{}/{}], loss:{:.4f}'.format(epoch + 1, epochs, epoch_loss))
-                break
-
-            torch.cuda.empty_cache()
+                embedding = np.lib.format.open_memmap(filepath, mode='w+', dtype=np.float32, shape=shape)
 
-        if plot_loss:
-            plot_losses(losses=train_losses, x_label="epoch", y_label="loss",
-                        title=f"emb_dim={self.embedding_dim}|lr={learning_rate}|alpha={self.alpha}|beta={self.beta}")
-
-        del A, L, x
+            with torch.no_grad():
+                for start in range(0, x.shape[0], chunk_size):
+                    chunk = self._to_input_tensor(x[start:start + chunk_size])
+                    embedding[start:start + chunk_size] = model.get_embedding(x=chunk)
+                    del chunk
+        else:
+            with torch.no_grad():
+                embedding = model.get_embedding(x=self._to_input_tensor(x))
+            if filepath is not None:
+                np.save(filepath, embedding)
+                embedding = np.load(filepath, mmap_mode='r')
+
+        if filepath is not None:
+            embedding.flush()
+        torch.cuda.empty_cache()
+        if is_graph_input:
+            self.embedding = embedding
+            self.embedding_fingerprint = uuid.uuid4().hex
+        return embedding
 
-    def get_embedding(self, x=None):
+    def get_reconstruction(self, x=None, threshold=None, top_k=None, chunk_size=1024):
         '''
 
-        :param x: graph input. Must have same dimension with the original graph
-        :return:
+        :param x: graph input. Default is the adjacency matrix of the graph.
+        :param threshold: keep only the reconstructed entries >= threshold
+        :param top_k: keep only the top_k largest reconstructed entries of each row
+        :param chunk_size: number of rows decoded at once when threshold or top_k is provided
+        :return: dense N x N array if threshold and top_k are None, else scipy csr matrix of the kept entries
         '''
-        if x is None:
-            x = self.A.todense()
-        # Convert to tensor for pytorch
-        x = torch.tensor(x).to(device)
-
-        with torch.no_grad():
-            embedding = self.model.to(device).get_embedding(x=x)
-        torch.cuda.empty_cache()
-        self.embedding = embedding
-        return embedding
+        model = self.model.to(device)
+        if threshold is None and top_k is None:
+            x = self._to_input_tensor(x)
+            with torch.no_grad():
+                reconstruction = model.get_reconstruction(x=x)
+            torch.cuda.empty_cache()
+            return reconstruction
 
-    def get_reconstruction(self, x=None):
         if x is None:
-            x = self.A.todense()
-        x = torch.tensor(x).to(device)
+            x = self.A
+        if sparse.issparse(x):
+            x = x.tocsr()
+        node_size = x.shape[1]
+        rows, cols, data = [], [], []
         with torch.no_grad():
-            reconstruction = self.model.to(device).get_reconstruction(x=x)
+            for start in range(0, x.shape[0], chunk_size):
+                chunk = model.get_reconstruction(x=self._to_input_tensor(x[start:start + chunk_size]))
+                if top_k is not None and top_k < node_size:
+                    chunk_cols = np.argpartition(-chunk, kth=top_k - 1, axis=1)[:, :top_k]
+                    chunk_data = np.take_along_axis(chunk, chunk_cols, axis=1).ravel()
+                    chunk_cols = chunk_cols.ravel()
+                    chunk_rows = np.repeat(np.arange(chunk.shape[0]), top_k)
+                    if threshold is not None:
+                        mask = chunk_data >= threshold
+                        chunk_rows, chunk_cols, chunk_data = chunk_rows[mask], chunk_cols[mask], chunk_data[mask]
+                else:
+                    mask = chunk >= (threshold if threshold is not None else -np.inf)
+                    chunk_rows, chunk_cols = np.nonzero(mask)
+                    chunk_data = chunk[mask]
+                rows.append(chunk_rows + start)
+                cols.append(chunk_cols)
+                data.append(chunk_data)
+                del chunk
         torch.cuda.empty_cache()
+
+        reconstruction = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(x.shape[0], node_size), dtype=np.float32
+        )
         return reconstruction
 
     def get_model(self):
         return self.model.cpu()
 
-    def save_embedding(self, filepath):
+    def save_embedding(self, folder_path, index=0):
+        '''
+        Atomically save the embedding in the embedding store folder_path, see embedding_store.save_embedding.
+        Nothing is written if the store already holds the embedding of the current weights.
+        '''
+        if embedding_store.is_saved(folder_path, index, self.embedding_fingerprint):
+            return
         if self.embedding is None:
             self.embedding = self.get_embedding()
-        with open(filepath, 'wb') as fp:
-            pickle.dump(self.embedding, fp)
+        embedding_store.save_embedding(folder_path, index, self.embedding, fingerprint=self.embedding_fingerprint)
 
-    def load_embedding(self, filepath):
-        with open(filepath, 'rb') as fp:
-            self.embedding = pickle.load(fp)
+    def load_embedding(self, folder_path, index=0, mmap_mode='r'):
+        self.embedding = embedding_store.load_embedding(folder_path, index, mmap_mode=mmap_mode)
+        self.embedding_fingerprint = embedding_store.get_fingerprint(folder_path, index)
         return self.embedding
 
 
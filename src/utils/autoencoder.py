@@ -41,7 +41,17 @@ class TPartCoder(nn.Module):
             self.layers.append(layer)
 
     def forward(self, x):
-        x = self.layers[0](x)
+        '''
+
+        :param x: dense tensor or sparse tensor (COO/CSR) with shape (batch_size, input_dim)
+        :return:
+        '''
+        if x.layout != torch.strided:
+            # Sparse-dense matmul on the first layer: cost scales with nnz(x) instead of batch_size x input_dim.
+            layer: nn.Linear = self.layers[0]
+            x = torch.sparse.mm(x, layer.weight.t()) + layer.bias
+        else:
+            x = self.layers[0](x)
         for i in range(1, len(self.layers)):
             x = nn.ReLU()(x)
             x = self.layers[i](x)
@@ -199,6 +209,19 @@ class TAutoencoder(nn.Module):
         reconstruction = reconstruction.clone().detach().cpu()
         return reconstruction.detach().numpy()
 
+    def get_param_groups(self):
+        '''
+        Parameter groups for LazyAdam. Only the columns of the first encoder layer touched by the batch have a
+        gradient, so this layer is updated lazily. The other parameters are dense, including the last decoder layer
+        whose gradient covers the N output columns of every batch row.
+        :return:
+        '''
+        first_layer: nn.Linear = self.encoder.layers[0]
+        return [
+            {'params': [first_layer.weight], 'lazy_dim': 1},
+            {'params': [p for p in self.parameters() if p is not first_layer.weight], 'lazy_dim': None},
+        ]
+
     def get_hidden_dims(self):
         '''
         Suppose encoder part and decoder part have symmetric size. So just return encoder part.
@@ -1,8 +1,32 @@
+from os.path import join
+
+
 class CheckpointConfig:
-    def __init__(self, number_saved=10, folder_path=None, index=None):
+    def __init__(self, number_saved=10, folder_path=None, index=None, interval_seconds=None):
+        '''
+        Periodic checkpoints of the training state, written in background by TStaticGE.train.
+        :param number_saved: save every number_saved epochs. None or 0 to disable
+        :param folder_path:
+        :param index: snapshot index, set by TDynGE.train_at
+        :param interval_seconds: also save when interval_seconds have passed since the last checkpoint
+        '''
         self.NumberSaved = number_saved
         self.FolderPath = folder_path
         self.Index = index
+        self.IntervalSeconds = interval_seconds
 
     def set_index(self, index):
         self.Index = index
+
+    def get_filepath(self):
+        return join(self.FolderPath, f"graph_{self.Index}_ck.pt")
+
+    def is_due(self, epoch, seconds_since_saved):
+        '''
+        :param epoch: number of epochs trained so far
+        :param seconds_since_saved: time since the last checkpoint
+        :return: True if a checkpoint must be saved now
+        '''
+        if self.NumberSaved and epoch % self.NumberSaved == 0:
+            return True
+        return self.IntervalSeconds is not None and seconds_since_saved >= self.IntervalSeconds
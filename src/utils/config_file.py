@@ -39,7 +39,9 @@ def read_config_file(filepath, config_task, verbose=False):
 
         # 'folder_paths': {
         'dataset_folder': f"./data/{dataset_name}",
+        'compiled_dataset_folder': f"./saved_data/compiled/{dataset_name}",
         'processed_link_pred_data_folder': f"./saved_data/processed_data/{dataset_name}_{config_task}",
+        'link_pred_cache_folder': f"./saved_data/processed_data/{dataset_name}_{config_task}_lgb",
 
         'dyge_weight_folder': f"./saved_data/models/{dataset_name}_{config_task}",
         'dyge_emb_folder': f"./saved_data/embeddings/{dataset_name}_{config_task}",
@@ -68,12 +70,15 @@ def read_config_file(filepath, config_task, verbose=False):
         'batch_size': int(dyge_cf['batch_size']) if dyge_cf['batch_size'] != 'None' else None,
         'early_stop': int(dyge_cf['early_stop']),  # 100
         'learning_rate_list': handle_int_list(dyge_cf['learning_rate_list']),
+        'lr_schedule': dyge_cf.get('lr_schedule', 'piecewise'),
         'alpha': float(dyge_cf['alpha']),
         'beta': float(dyge_cf['beta']),
         'l1': float(dyge_cf['l1']),
         'l2': float(dyge_cf['l2']),
         'net2net_applied': dyge_cf.getboolean('net2net_applied'),
         'ck_length_saving': int(dyge_cf['ck_length_saving']),
+        'ck_interval_seconds': float(dyge_cf['ck_interval_seconds'])
+        if dyge_cf.get('ck_interval_seconds', 'None') != 'None' else None,
         'ck_folder': f'./saved_data/models/{dataset_name}_{config_task}_ck',
         'dyge_shuffle': dyge_cf.getboolean('dyge_shuffle'),
         'dyge_activation': dyge_cf['dyge_activation'],
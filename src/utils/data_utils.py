@@ -1,16 +1,69 @@
-import os
 import pickle
-from os import listdir, makedirs
+from os import listdir, makedirs, replace
 from os.path import isfile, join, exists
 import pandas as pd
 import networkx as nx
 import numpy as np
 import gensim.models.keyedvectors as word2vec
+from scipy import sparse
 
 from src.data_preprocessing.graph_preprocessing import get_graph_from_file
+from src.utils import embedding_store
+from src.utils.graph_util import csr_to_graph
+
+
+PROCESSED_COLUMNS = {'node_1': np.int32, 'node_2': np.int32, 'link': np.uint8}
+PROCESSED_GRAPH_ARRAYS = ['nodes', 'indptr', 'indices', 'data']
+
+
+def _processed_indices(folder):
+    '''
+    Indices of the snapshots saved by save_processed_data in folder. Empty for the legacy json/gpickle format.
+    '''
+    suffix = "_link.npy"
+    files = [f for f in listdir(folder) if isfile(join(folder, f)) and f.startswith("graph_") and f.endswith(suffix)]
+    return sorted(int(f[len("graph_"):-len(suffix)]) for f in files)
+
+
+def load_processed_arrays(folder, index, mmap_mode='r'):
+    '''
+    Memory-mapped arrays of the processed link prediction data of save_processed_data. Nothing is read in memory
+    until it is accessed: use it instead of load_processed_data / load_single_processed_data to avoid copies.
+    :param folder:
+    :param index:
+    :param mmap_mode: see np.load
+    :return: pairs {'node_1', 'node_2', 'link'}, reduced graph as CSR and the node of each row
+    '''
+    pairs = {name: np.load(join(folder, f"graph_{index}_{name}.npy"), mmap_mode=mmap_mode)
+             for name in PROCESSED_COLUMNS}
+    nodes, indptr, indices, data = (np.load(join(folder, f"graph_{index}_{name}.npy"), mmap_mode=mmap_mode)
+                                    for name in PROCESSED_GRAPH_ARRAYS)
+    A = sparse.csr_matrix((data, indices, indptr), shape=(len(nodes), len(nodes)), copy=False)
+    return pairs, A, nodes
+
+
+def _load_processed(folder, index):
+    '''
+    DataFrame and networkx graph of a snapshot, built in memory from the arrays of load_processed_arrays
+    '''
+    pairs, A, nodes = load_processed_arrays(folder, index)
+    return pd.DataFrame(pairs, copy=False), csr_to_graph(A, nodes)
 
 
 def load_processed_data(folder):
+    '''
+    DataFrames and graphs of every snapshot, read in memory. See load_processed_arrays for memory-mapped access.
+    '''
+    indices = _processed_indices(folder)
+    if len(indices) > 0:
+        graphs_df, graphs = [], []
+        for index in indices:
+            graph_df, graph = _load_processed(folder, index)
+            graphs_df.append(graph_df)
+            graphs.append(graph)
+        return graphs_df, graphs
+
+    # Legacy format
     files = [f for f in listdir(folder) if isfile(join(folder, f))]
     graphs_df = []
     graphs = []
@@ -23,6 +76,14 @@ def load_processed_data(folder):
 
 
 def load_single_processed_data(folder):
+    '''
+    DataFrame and graph of the last snapshot, read in memory. See load_processed_arrays for memory-mapped access.
+    '''
+    indices = _processed_indices(folder)
+    if len(indices) > 0:
+        return _load_processed(folder, indices[-1])
+
+    # Legacy format
     files = [f for f in listdir(folder) if isfile(join(folder, f))]
     graph_df = None
     graph = None
@@ -35,12 +96,34 @@ def load_single_processed_data(folder):
     return graph_df, graph
 
 
+def _save_array(filepath, array):
+    # A crash never leaves a truncated file under the final name
+    with open(filepath + ".tmp", 'wb') as fo:
+        np.save(fo, array)
+    replace(filepath + ".tmp", filepath)
+
+
 def save_processed_data(graph_df: pd.DataFrame, graph: nx.Graph, folder, index):
+    '''
+    Save processed link prediction data as .npy files, loaded memory-mapped by load_processed_arrays:
+        graph_{index}_node_1.npy, graph_{index}_node_2.npy (int32), graph_{index}_link.npy (uint8)
+        graph_{index}_nodes.npy: node of each row of the reduced graph
+        graph_{index}_indptr.npy, graph_{index}_indices.npy, graph_{index}_data.npy: CSR of the reduced graph
+    :param graph_df: DataFrame [node_1, node_2, link]
+    :param graph: reduced graph
+    :param folder:
+    :param index:
+    :return:
+    '''
     if not exists(folder):
         makedirs(folder)
-    # nx.write_edgelist(graph, f'{folder}/graph{index}.edgelist', data=False)
-    nx.write_gpickle(graph, f'{folder}/graph_{index}.gpickle')
-    graph_df.to_json(join(folder, f"graph_{index}.json"))
+    nodes = np.fromiter(graph.nodes, dtype=np.int64, count=graph.number_of_nodes())
+    A = nx.to_scipy_sparse_matrix(graph, nodelist=nodes, weight=None, format='csr')
+    arrays = {name: graph_df[name].to_numpy().astype(dtype) for name, dtype in PROCESSED_COLUMNS.items()}
+    arrays.update({'nodes': nodes, 'indptr': A.indptr, 'indices': A.indices, 'data': A.data.astype(np.float32)})
+    # Each file is moved in place once written and the link column comes last: it marks a complete snapshot
+    for name in PROCESSED_GRAPH_ARRAYS + ['node_1', 'node_2', 'link']:
+        _save_array(join(folder, f"graph_{index}_{name}.npy"), arrays[name])
 
 
 def load_embedding(filepath):
@@ -50,22 +133,14 @@ def load_embedding(filepath):
 
 
 def load_dy_embeddings(folder_path, index=None):
+    '''
+    Embeddings of an embedding store (memory-mapped), see embedding_store.load_embeddings
+    :param folder_path:
+    :param index: snapshot index. Default is every snapshot
+    :return: list of embeddings
+    '''
     print("Folder_path: ", folder_path)
-    if not os.path.exists(folder_path):
-        raise ValueError("Folder is invalid.")
-
-    if index is not None:
-        file = join(folder_path, f"_{index}")
-        return [load_embedding(filepath=file)]
-
-    embeddings = []
-    files = [f for f in os.listdir(folder_path) if isfile(join(folder_path, f))]
-    length = len(files)
-    for idx in range(length):
-        print("emb: ", join(folder_path, f"_{idx}"))
-        embedding = load_embedding(filepath=join(folder_path, f"_{idx}"))
-        embeddings.append(embedding)
-    return embeddings
+    return embedding_store.load_embeddings(folder_path, index=index)
 
 
 def load_node2vec_embeddings(graphs, folder_path, index=None):
@@ -0,0 +1,150 @@
+import json
+import os
+import pickle
+from os.path import join, exists
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+
+
+def get_embedding_path(folder_path, index):
+    return join(folder_path, f"embedding_{index}.npy")
+
+
+def get_tmp_embedding_path(folder_path, index):
+    '''
+    Path to write an embedding before commit_embedding_file moves it in place
+    '''
+    return join(folder_path, f"embedding_{index}.tmp.npy")
+
+
+def _write_json(filepath, obj):
+    with open(filepath + ".tmp", 'w') as fo:
+        json.dump(obj, fo, indent=2)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def load_manifest(folder_path):
+    '''
+    Manifest of an embedding folder: {'snapshots': {index: {'file', 'shape', 'dtype', 'node_count', 'fingerprint'}}}
+    '''
+    filepath = join(folder_path, MANIFEST_FILE)
+    if not exists(filepath):
+        return {'snapshots': {}}
+    with open(filepath) as fi:
+        return json.load(fi)
+
+
+def commit_embedding_file(folder_path, index, tmp_path, fingerprint=None):
+    '''
+    Move an embedding .npy file written at tmp_path in place and register it in the manifest. Readers see either
+    the previous or the new embedding, never a partial file.
+    :param folder_path:
+    :param index: snapshot index
+    :param tmp_path:
+    :param fingerprint: identifier of the embedding (see TStaticGE.embedding_fingerprint), to skip saving it again
+    :return:
+    '''
+    filepath = get_embedding_path(folder_path, index)
+    os.replace(tmp_path, filepath)
+    embedding = np.load(filepath, mmap_mode='r')
+    manifest = load_manifest(folder_path)
+    manifest['snapshots'][str(index)] = {
+        'file': os.path.basename(filepath),
+        'shape': list(embedding.shape),
+        'dtype': str(embedding.dtype),
+        'node_count': int(embedding.shape[0]),
+        'fingerprint': fingerprint,
+    }
+    _write_json(join(folder_path, MANIFEST_FILE), manifest)
+
+
+def save_embedding(folder_path, index, embedding, fingerprint=None):
+    '''
+    Atomically save the embedding of a snapshot as folder_path/embedding_[index].npy
+    :param folder_path:
+    :param index: snapshot index
+    :param embedding: array (N, d)
+    :param fingerprint: see commit_embedding_file
+    :return:
+    '''
+    if not exists(folder_path):
+        os.makedirs(folder_path)
+    tmp_path = get_tmp_embedding_path(folder_path, index)
+    np.save(tmp_path, np.asarray(embedding))
+    commit_embedding_file(folder_path, index, tmp_path, fingerprint=fingerprint)
+
+
+def get_fingerprint(folder_path, index):
+    '''
+    Fingerprint of the saved embedding of a snapshot, None if there is none
+    '''
+    entry = load_manifest(folder_path)['snapshots'].get(str(index))
+    return None if entry is None else entry.get('fingerprint')
+
+
+def is_saved(folder_path, index, fingerprint):
+    '''
+    True if the embedding identified by fingerprint is the saved embedding of the snapshot
+    '''
+    return fingerprint is not None and get_fingerprint(folder_path, index) == fingerprint
+
+
+def get_snapshot_indices(folder_path):
+    '''
+    Indices of the snapshots saved in folder_path. Falls back on the legacy pickled files _0, _1, ...
+    '''
+    manifest = load_manifest(folder_path)
+    if len(manifest['snapshots']) > 0:
+        return sorted(int(index) for index in manifest['snapshots'])
+    indices = []
+    while exists(join(folder_path, f"_{len(indices)}")):
+        indices.append(len(indices))
+    return indices
+
+
+def load_embedding(folder_path, index, mmap_mode='r'):
+    '''
+    Embedding of a snapshot, memory-mapped by default. Legacy pickled files _[index] are read in memory.
+    :param folder_path:
+    :param index: snapshot index
+    :param mmap_mode: see np.load. None reads the whole matrix in memory
+    :return:
+    '''
+    entry = load_manifest(folder_path)['snapshots'].get(str(index))
+    if entry is not None:
+        return np.load(join(folder_path, entry['file']), mmap_mode=mmap_mode)
+
+    legacy_path = join(folder_path, f"_{index}")
+    if exists(legacy_path):
+        with open(legacy_path, 'rb') as fp:
+            return pickle.load(fp)
+    raise ValueError(f"No embedding of snapshot {index} in {folder_path}.")
+
+
+def load_embeddings(folder_path, index=None, mmap_mode='r'):
+    '''
+    :param folder_path:
+    :param index: snapshot index or list of indices. Default is every snapshot
+    :param mmap_mode: see np.load
+    :return: list of embeddings
+    '''
+    if not exists(folder_path):
+        raise ValueError("Folder is invalid.")
+    if index is None:
+        index = get_snapshot_indices(folder_path)
+    elif np.isscalar(index):
+        index = [index]
+    return [load_embedding(folder_path, i, mmap_mode=mmap_mode) for i in index]
+
+
+def load_node_embeddings(folder_path, nodes, index=None):
+    '''
+    Embedding of some nodes across snapshots. Only the requested rows are read from disk.
+    :param folder_path:
+    :param nodes: node index, array of node indices or slice (e.g. slice(100, 200))
+    :param index: snapshot index or list of indices. Default is every snapshot
+    :return: list of arrays, one per snapshot
+    '''
+    return [np.array(embedding[nodes]) for embedding in load_embeddings(folder_path, index=index, mmap_mode='r')]
@@ -1,6 +1,7 @@
 from sklearn.linear_model import LogisticRegression
 import numpy as np
 import networkx as nx
+from scipy import sparse
 from sklearn.model_selection import train_test_split
 from munkres import Munkres
 from sklearn.metrics.cluster import normalized_mutual_info_score as nmi_score
@@ -89,9 +90,18 @@ def cluster_evaluate(y_true, y_pred, alg=0):
 
 
 def reconstruction_mse(reconstruction, graph: nx.Graph):
-    X = np.array(nx.adjacency_matrix(graph).todense())
+    '''
+
+    :param reconstruction: dense N x N array or scipy sparse matrix from get_reconstruction(threshold=..|top_k=..).
+        Entries missing in a sparse reconstruction count as 0.
+    :param graph:
+    :return:
+    '''
+    X = nx.adjacency_matrix(graph).astype(np.float32)
     X_hat = reconstruction
-    err = np.sum(np.sqrt(np.square(X_hat - X)))
+    if sparse.issparse(X_hat):
+        return abs(X_hat - X).sum()
+    err = np.sum(np.sqrt(np.square(X_hat - X.toarray())))
     return err
 
 
@@ -104,16 +114,25 @@ def dy_reconstruction_accuracy(reconstructions, graphs):
 
 
 def reconstruction_accuracy(reconstruction, graph: nx.Graph):
+    '''
+
+    :param reconstruction: dense N x N array or scipy sparse matrix from get_reconstruction(threshold=..|top_k=..).
+        A sparse reconstruction must keep the entries >= 0.1 (the threshold checked here).
+    :param graph:
+    :return:
+    '''
     print("\nReconstruction accuracy:")
     max_acc = 0
     thresholds = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+    edges = np.array(graph.edges(), dtype=np.int64).reshape(-1, 2)
+    if sparse.issparse(reconstruction):
+        reconstruction = reconstruction.tocsr()
+        edge_values = np.asarray(reconstruction[edges[:, 0], edges[:, 1]]).ravel()
+    else:
+        edge_values = reconstruction[edges[:, 0], edges[:, 1]]
+
     for threshold in thresholds[:1]:
-        g = np.zeros_like(reconstruction)
-        g[reconstruction >= threshold] = 1.0
-        pred_count = 0
-        for u, v in graph.edges():
-            if g[u][v] == 1.0:
-                pred_count += 1
+        pred_count = np.count_nonzero(edge_values >= threshold)
         print(f"With threshold {threshold}: {pred_count / graph.number_of_edges()}")
         max_acc = max(max_acc, pred_count / graph.number_of_edges())
     return max_acc
@@ -1,5 +1,7 @@
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from scipy import sparse
 
 
 def print_graph_stats(G: nx.Graph, name="", end="\n"):
@@ -40,6 +42,41 @@ def graph_to_graph_idx(g: nx.Graph):
     return graph2idx, idx2node
 
 
+def graph_to_csr(g: nx.Graph, node_size=None):
+    '''
+    Binary adjacency matrix where row/column i is node i. Nodes of the graph must be indices.
+    :param g:
+    :param node_size: number of rows. Default is max node index + 1
+    :return: csr matrix (node_size x node_size) with int8 entries
+    '''
+    edges = np.array(g.edges(), dtype=np.int64).reshape(-1, 2)
+    if node_size is None:
+        node_size = max(g.nodes) + 1 if g.number_of_nodes() > 0 else 0
+    A = sparse.csr_matrix((np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])),
+                          shape=(node_size, node_size))
+    if not g.is_directed():
+        A = A.maximum(A.T).tocsr()
+    A.data[:] = 1
+    return A
+
+
+def csr_to_graph(A, nodes=None):
+    '''
+    Undirected graph of a symmetric adjacency matrix. Every row is a node, isolated or not.
+    :param A: scipy sparse matrix
+    :param nodes: node of each row. Default is the row index
+    :return:
+    '''
+    if nodes is None:
+        nodes = np.arange(A.shape[0])
+    nodes = np.asarray(nodes)
+    coo = sparse.triu(A).tocoo()
+    G = nx.Graph()
+    G.add_nodes_from(nodes.tolist())
+    G.add_edges_from(zip(nodes[coo.row].tolist(), nodes[coo.col].tolist()))
+    return G
+
+
 def idx_to_graph(g: nx.Graph, idx2node: {}):
     original_graph = nx.Graph()
     for u, v in g.edges():
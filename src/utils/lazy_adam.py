@@ -0,0 +1,77 @@
+import math
+
+import torch
+from torch.optim import Optimizer
+
+
+class LazyAdam(Optimizer):
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, lazy_dim=None):
+        '''
+        Adam which updates only the slices of the parameters touched by the batch, like lazy/sparse Adam.
+        Parameter groups with 'lazy_dim' (0: rows, 1: columns) are updated on the indices passed to step(). Parameters
+        and moments of the other slices are left as they are, so a step costs O(touched x h) instead of O(N x h).
+        Groups without 'lazy_dim' are updated as torch.optim.Adam.
+        :param params: parameters or parameter groups
+        :param lr:
+        :param betas:
+        :param eps:
+        :param weight_decay: L2 penalty added to the gradient, same as torch.optim.Adam
+        :param lazy_dim: default lazy dimension of the groups
+        '''
+        if lr < 0.0:
+            raise ValueError(f"Invalid learning rate: {lr}")
+        defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, lazy_dim=lazy_dim)
+        super(LazyAdam, self).__init__(params, defaults)
+
+    @torch.no_grad()
+    def step(self, index=None):
+        '''
+
+        :param index: long tensor of the touched rows/columns (node indices) of the batch.
+            If None, every parameter is updated as Adam.
+        :return:
+        '''
+        for group in self.param_groups:
+            beta1, beta2 = group['betas']
+            lazy_dim = group['lazy_dim']
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+
+                state = self.state[p]
+                if len(state) == 0:
+                    state['step'] = 0
+                    state['exp_avg'] = torch.zeros_like(p)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
+                state['step'] += 1
+
+                if lazy_dim is None or index is None:
+                    _adam_update(p, p.grad, state['exp_avg'], state['exp_avg_sq'], step=state['step'],
+                                 lr=group['lr'], beta1=beta1, beta2=beta2, eps=group['eps'],
+                                 weight_decay=group['weight_decay'])
+                    continue
+
+                # Bias vectors of the N-wide layer only have one dimension
+                dim = min(lazy_dim, p.dim() - 1)
+                param = p.index_select(dim, index)
+                exp_avg = state['exp_avg'].index_select(dim, index)
+                exp_avg_sq = state['exp_avg_sq'].index_select(dim, index)
+                _adam_update(param, p.grad.index_select(dim, index), exp_avg, exp_avg_sq, step=state['step'],
+                             lr=group['lr'], beta1=beta1, beta2=beta2, eps=group['eps'],
+                             weight_decay=group['weight_decay'])
+                p.index_copy_(dim, index, param)
+                state['exp_avg'].index_copy_(dim, index, exp_avg)
+                state['exp_avg_sq'].index_copy_(dim, index, exp_avg_sq)
+
+
+def _adam_update(param, grad, exp_avg, exp_avg_sq, step, lr, beta1, beta2, eps, weight_decay):
+    if weight_decay != 0:
+        grad = grad.add(param, alpha=weight_decay)
+
+    exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+
+    bias_correction1 = 1 - beta1 ** step
+    bias_correction2 = 1 - beta2 ** step
+    denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(eps)
+    param.addcdiv_(exp_avg, denom, value=-lr / bias_correction1)
@@ -1,70 +1,211 @@
+import hashlib
+import os
+from os.path import join
 from time import time
 import networkx as nx
 import numpy as np
+from scipy import sparse
 from sklearn.metrics import roc_auc_score, roc_curve
-from sklearn.model_selection import train_test_split
-from tqdm import tqdm
 import lightgbm
 import pandas as pd
 import matplotlib.pyplot as plt
 
-
-def get_unconnected_pairs_(G: nx.Graph, cutoff=2, n_limit=None):
-    edges_len = dict(nx.all_pairs_shortest_path_length(G, cutoff=cutoff))
-
-    unconnected_pairs = []
-    appended_pairs = {}
-
-    nodes = list(G.nodes())
-    for u in edges_len.keys():
-        if u not in appended_pairs:
-            appended_pairs[u] = {}
-        for v in edges_len[u].keys():
-            if v not in appended_pairs:
-                appended_pairs[v] = {}
-            if u != v and v not in appended_pairs[u] and not G.has_edge(u, v):
-                unconnected_pairs.append({
-                    'node_1': u,
-                    'node_2': v
-                })
-
-                appended_pairs[u][v] = True
-                appended_pairs[v][u] = True
-
-    if n_limit is not None:
-        unconnected_pairs = np.random.choice(unconnected_pairs, size=min(n_limit, len(unconnected_pairs)),
-                                             replace=False)
-        unconnected_pairs = list(unconnected_pairs)
-
-    return unconnected_pairs
-
-
-def run_link_pred_evaluate(graph_df, embeddings, alg=None, num_boost_round=10000, early_stopping_rounds=100):
-    if alg == "Node2Vec":
-        x = [(embeddings[str(i)] + embeddings[str(j)]) for i, j in zip(graph_df['node_1'], graph_df['node_2'])]
+from src.utils.pair_features import build_pair_features, iter_pair_features, embedding_from_keyed_vectors, \
+    get_feature_dim
+
+
+def _unconnected_pairs_blocks(A, cutoff, block_size):
+    '''
+    Unconnected pairs (u, v), u < v, at distance <= cutoff, by blocks of rows of the adjacency matrix.
+    Reachability of a block is rows + rows.A + ... + rows.A^(cutoff - 1), masked by the links of the block.
+    '''
+    node_size = A.shape[0]
+    for r0 in range(0, node_size, block_size):
+        rows = A[r0:min(r0 + block_size, node_size)]
+        reach = rows.copy()
+        frontier = rows
+        for _ in range(cutoff - 1):
+            frontier = frontier.dot(A)
+            frontier.data[:] = 1
+            reach = reach + frontier
+        reach = (reach - reach.multiply(rows)).tocoo()
+        keep = (reach.data != 0) & (reach.col > reach.row + r0)
+        yield (reach.row[keep] + r0).astype(np.int32), reach.col[keep].astype(np.int32)
+
+
+def get_unconnected_index_pairs(A, cutoff=2, n_limit=None, block_size=4096):
+    '''
+    Pairs of nodes which are not linked but at distance <= cutoff, built from sparse products of the csr adjacency
+    matrix by blocks of rows.
+    :param A: adjacency matrix in scipy sparse format
+    :param cutoff: max distance between two nodes of a pair
+    :param n_limit: if provided, uniformly sample n_limit pairs without materializing all pairs
+    :param block_size: number of rows per block
+    :return: int32 arrays u, v of row indices with u < v
+    '''
+    A = sparse.csr_matrix(A, dtype=np.float32)
+    A.data[:] = 1
+
+    if n_limit is None:
+        blocks = list(_unconnected_pairs_blocks(A, cutoff, block_size))
     else:
-        x = [(embeddings[i] + embeddings[j]) for i, j in zip(graph_df['node_1'], graph_df['node_2'])]
-
+        # First pass counts pairs of each block, then the samples are spread over blocks by hypergeometric draws
+        # and each block is recomputed to pick its share.
+        counts = [len(u) for u, _ in _unconnected_pairs_blocks(A, cutoff, block_size)]
+        remaining_total = int(np.sum(counts))
+        remaining_draw = min(n_limit, remaining_total)
+        blocks = []
+        for count, (u, v) in zip(counts, _unconnected_pairs_blocks(A, cutoff, block_size)):
+            if remaining_draw == 0:
+                break
+            if count == remaining_total:
+                draw = remaining_draw
+            else:
+                draw = np.random.hypergeometric(count, remaining_total - count, remaining_draw)
+            selected = np.random.choice(count, size=draw, replace=False)
+            blocks.append((u[selected], v[selected]))
+            remaining_total -= count
+            remaining_draw -= draw
+
+    if len(blocks) == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    return np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks])
+
+
+def get_unconnected_pairs_(G: nx.Graph, cutoff=2, n_limit=None, block_size=4096):
+    '''
+    Pairs of nodes which are not linked but at distance <= cutoff. See get_unconnected_index_pairs.
+    :return: int32 arrays u, v of nodes with u < v
+    '''
+    nodes = np.array(sorted(G.nodes()))
+    A = nx.to_scipy_sparse_matrix(G, nodelist=nodes, format='csr')
+    u, v = get_unconnected_index_pairs(A, cutoff=cutoff, n_limit=n_limit, block_size=block_size)
+    return nodes[u].astype(np.int32), nodes[v].astype(np.int32)
+
+
+def stratified_split_index(labels, test_size=0.25, seed=35):
+    '''
+    Stratified train/test split on row indices, so the features never have to be copied into split arrays.
+    :param labels:
+    :param test_size:
+    :param seed:
+    :return: train_index, test_index (sorted)
+    '''
+    labels = np.asarray(labels)
+    rng = np.random.RandomState(seed)
+    train_index, test_index = [], []
+    for label in np.unique(labels):
+        index = rng.permutation(np.flatnonzero(labels == label))
+        n_test = int(np.ceil(test_size * len(index)))
+        test_index.append(index[:n_test])
+        train_index.append(index[n_test:])
+    return np.sort(np.concatenate(train_index)), np.sort(np.concatenate(test_index))
+
+
+def embedding_fingerprint(embedding, *arrays, chunk_size=65536):
+    '''
+    Content hash of an embedding matrix (and optional extra arrays, e.g. the node pairs), read chunk by chunk.
+    :return: hex string
+    '''
+    h = hashlib.sha1()
+    for array in (embedding,) + arrays:
+        array = np.asarray(array)
+        h.update(f"{array.shape}{array.dtype}".encode())
+        for start in range(0, len(array), chunk_size):
+            h.update(np.ascontiguousarray(array[start:start + chunk_size]).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _build_split_features(embeddings, u, v, operator, filepath=None):
+    if filepath is None:
+        return build_pair_features(embeddings, u, v, operator=operator)
+    out = np.lib.format.open_memmap(
+        filepath + ".tmp.npy", mode='w+', dtype=np.float32,
+        shape=(len(u), get_feature_dim(np.shape(embeddings)[1], operator))
+    )
+    build_pair_features(embeddings, u, v, operator=operator, out=out)
+    out.flush()
+    del out
+    os.replace(filepath + ".tmp.npy", filepath)
+    return np.load(filepath, mmap_mode='r')
+
+
+def build_link_pred_datasets(graph_df, embeddings, alg=None, operator='sum', cache_folder=None, test_size=0.25,
+                             seed=35):
+    '''
+    Build the LightGBM train/test datasets of the link prediction pairs.
+    Features are written chunk by chunk; with cache_folder they go to memory-mapped .npy files and the constructed
+    LightGBM datasets are saved as binary files keyed by algorithm, operator and embedding fingerprint, so the next
+    run with the same embedding skips feature construction and binning.
+    :param graph_df: DataFrame [node_1, node_2, link]
+    :param embeddings:
+    :param alg:
+    :param operator: see pair_features.PAIR_OPERATORS
+    :param cache_folder:
+    :param test_size:
+    :param seed:
+    :return: train_data, test_data, X_test, y_test
+    '''
+    u, v = graph_df['node_1'].to_numpy(), graph_df['node_2'].to_numpy()
+    labels = graph_df['link'].to_numpy()
+    if alg == "Node2Vec":
+        embeddings, u, v = embedding_from_keyed_vectors(embeddings, u, v)
+    train_index, test_index = stratified_split_index(labels, test_size=test_size, seed=seed)
+    y_train, y_test = labels[train_index], labels[test_index]
+
+    paths = {}
+    if cache_folder is not None:
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        key = f"{alg or 'embedding'}_{operator}_{embedding_fingerprint(embeddings, u, v, labels)}"
+        for name in ['train.bin', 'test.bin', 'train_features.npy', 'test_features.npy']:
+            paths[name] = join(cache_folder, f"{key}_{name}")
+        if all(os.path.exists(paths[name]) for name in ['train.bin', 'test.bin', 'test_features.npy']):
+            print(f"Load cached LightGBM datasets: {key}")
+            train_data = lightgbm.Dataset(paths['train.bin'])
+            test_data = lightgbm.Dataset(paths['test.bin'], reference=train_data)
+            return train_data, test_data, np.load(paths['test_features.npy'], mmap_mode='r'), y_test
+
+    print("Build pair features")
+    X_train = _build_split_features(embeddings, u[train_index], v[train_index], operator,
+                                    filepath=paths.get('train_features.npy'))
+    X_test = _build_split_features(embeddings, u[test_index], v[test_index], operator,
+                                   filepath=paths.get('test_features.npy'))
+    train_data = lightgbm.Dataset(X_train, y_train)
+    test_data = lightgbm.Dataset(X_test, y_test, reference=train_data)
+    if cache_folder is not None:
+        train_data.construct()
+        test_data.construct()
+        for name, dataset in [('train.bin', train_data), ('test.bin', test_data)]:
+            if os.path.exists(paths[name]):
+                os.remove(paths[name])
+            dataset.save_binary(paths[name])
+        # Train features are in the binary dataset now
+        del X_train
+        os.remove(paths['train_features.npy'])
+    return train_data, test_data, X_test, y_test
+
+
+def run_link_pred_evaluate(graph_df, embeddings, alg=None, num_boost_round=10000, early_stopping_rounds=100,
+                           operator='sum', cache_folder=None):
     # TODO: check unbalance dataset
-    # TODO: cannot split with big data
-    data_ = np.array(x)
-    print("train_test_split")
-    X_train, X_test, y_train, y_test = train_test_split(
-        data_,
-        graph_df['link'],
+    train_data, test_data, X_test, y_test = build_link_pred_datasets(
+        graph_df=graph_df,
+        embeddings=embeddings,
+        alg=alg,
+        operator=operator,
+        cache_folder=cache_folder,
         test_size=0.25,
-        random_state=35,
-        stratify=graph_df['link']
+        seed=35
     )
+    n_link = int(np.count_nonzero(graph_df['link'].to_numpy() == 1))
+    n_unlink = len(graph_df) - n_link
     print(
-        f"|Link=1|={list(graph_df['link']).count(1)}\t"
-        f"|Link=0|={list(graph_df['link']).count(0)}\t\t"
-        f"|Percent Link=1/Link=0|={round(list(graph_df['link']).count(1) / list(graph_df['link']).count(0), 4)}"
+        f"|Link=1|={n_link}\t"
+        f"|Link=0|={n_unlink}\t\t"
+        f"|Percent Link=1/Link=0|={round(n_link / n_unlink, 4)}"
     )
 
-    train_data = lightgbm.Dataset(X_train, y_train)
-    test_data = lightgbm.Dataset(X_test, y_test)
-
     # TODO: add GPU training
     # define parameters
     parameters = {
@@ -98,110 +239,236 @@ def run_link_pred_evaluate(graph_df, embeddings, alg=None, num_boost_round=10000
     return model
 
 
+def top_k_index(scores, k):
+    '''
+    Indices of the k highest scores, in descending order of score. argpartition selects them in O(n), only those k
+    are sorted.
+    :param scores:
+    :param k:
+    :return:
+    '''
+    scores = np.asarray(scores).ravel()
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    index = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return index[np.argsort(-scores[index], kind='stable')]
+
+
+def merge_top_k(top_scores, top_index, scores, offset, k):
+    '''
+    Merge the running top-k with the top-k of a new chunk of scores.
+    :param top_scores: scores of the running top-k
+    :param top_index: global row indices of the running top-k
+    :param scores: scores of the chunk
+    :param offset: global row index of the first score of the chunk
+    :param k:
+    :return: top_scores, top_index (descending order of score)
+    '''
+    chunk_index = top_k_index(scores, k)
+    candidate_scores = np.concatenate((top_scores, np.asarray(scores).ravel()[chunk_index]))
+    candidate_index = np.concatenate((top_index, chunk_index + offset))
+    best = top_k_index(candidate_scores, k)
+    return candidate_scores[best], candidate_index[best]
+
+
 def top_k_prediction_edges(G: nx.Graph, y_pred, possible_edges_df, top_k, show_acc_on_edge=False, plot_link_pred=False,
-                           limit_node=100, idx2node=None):
+                           limit_node=100, idx2node=None, top_index=None):
+    '''
+
+    :param G:
+    :param y_pred: scores of all rows of possible_edges_df, or the scores of the rows top_index when given
+    :param possible_edges_df:
+    :param top_k:
+    :param show_acc_on_edge:
+    :param plot_link_pred:
+    :param limit_node:
+    :param idx2node:
+    :param top_index: row indices of the top predictions, e.g. from run_predict_top_k
+    :return:
+    '''
     # get top K link prediction
-    # sorted_y_pred, sorted_possible_edges = zip(*sorted(zip(y_pred, possible_egdes)))
-    node_1 = possible_edges_df['node_1'].to_list()
-    node_2 = possible_edges_df['node_2'].to_list()
-
-    # unconnected_edges = [possible_egdes_df['node_1'].to_list(), possible_egdes_df['node_2'].to_list()]
-    unconnected_edges = [(node_1[i], node_2[i]) for i in range(len(node_1))]
-    sorted_y_pred, sorted_possible_edges = (list(t) for t in zip(*sorted(zip(y_pred, unconnected_edges), reverse=True)))
+    y_pred = np.asarray(y_pred).ravel()
+    if top_index is None:
+        top_index = top_k_index(y_pred, top_k)
+        top_y_pred = y_pred[top_index]
+    else:
+        order = top_k_index(y_pred, top_k)
+        top_index, top_y_pred = np.asarray(top_index)[order], y_pred[order]
+    top_k = len(top_index)
+    node_1 = possible_edges_df['node_1'].to_numpy()[top_index]
+    node_2 = possible_edges_df['node_2'].to_numpy()[top_index]
+    sorted_possible_edges = list(zip(node_1.tolist(), node_2.tolist()))
+    sorted_y_pred = top_y_pred.tolist()
 
     if plot_link_pred:
         if len(G.nodes) > limit_node:
             G.remove_nodes_from(nodes=list(G.nodes)[limit_node:])
         if show_acc_on_edge:
-            plot_link_prediction_graph(G=G, pred_edges=sorted_possible_edges[:top_k], pred_acc=sorted_y_pred[:top_k],
+            plot_link_prediction_graph(G=G, pred_edges=sorted_possible_edges, pred_acc=sorted_y_pred,
                                        idx2node=idx2node)
         else:
-            plot_link_prediction_graph(G=G, pred_edges=sorted_possible_edges[:top_k], idx2node=idx2node)
+            plot_link_prediction_graph(G=G, pred_edges=sorted_possible_edges, idx2node=idx2node)
 
     if idx2node is None:
-        original_pred_edges = sorted_possible_edges[:top_k]
+        original_pred_edges = sorted_possible_edges
     else:
-        original_pred_edges = [(idx2node[u], idx2node[v]) for u, v in sorted_possible_edges[:top_k]]
+        original_pred_edges = [(idx2node[u], idx2node[v]) for u, v in sorted_possible_edges]
 
     print(f"Top {top_k} predicted edges: edge|accuracy")
     for i in range(top_k):
         print(f"{original_pred_edges[i]} : {round(sorted_y_pred[i], 2)}")
 
-    return original_pred_edges, sorted_y_pred[:top_k]
-
-
-def run_predict(data, embedding, model):
-    x = [(embedding[i] + embedding[j]) for i, j in zip(data['node_1'], data['node_2'])]
-    y_pred = model.predict(x)
-    return y_pred
-
+    return original_pred_edges, sorted_y_pred
+
+
+def run_predict(data, embedding, model, operator='sum', chunk_size=65536):
+    y_pred = [
+        model.predict(features)
+        for _, features in iter_pair_features(embedding, data['node_1'].to_numpy(), data['node_2'].to_numpy(),
+                                              operator=operator, chunk_size=chunk_size)
+    ]
+    return np.concatenate(y_pred) if len(y_pred) > 0 else np.empty(0)
+
+
+def run_predict_top_k(data, embedding, model, top_k, operator='sum', chunk_size=65536):
+    '''
+    Predict the pairs batch by batch and keep only the running top-k, so the full score array is never stored.
+    :param data: DataFrame [node_1, node_2]
+    :param embedding:
+    :param model:
+    :param top_k:
+    :param operator:
+    :param chunk_size:
+    :return: top_scores, top_index (row indices of data, descending order of score)
+    '''
+    top_scores, top_index = np.empty(0), np.empty(0, dtype=np.int64)
+    for start, features in iter_pair_features(embedding, data['node_1'].to_numpy(), data['node_2'].to_numpy(),
+                                              operator=operator, chunk_size=chunk_size):
+        top_scores, top_index = merge_top_k(top_scores, top_index, model.predict(features), start, top_k)
+    return top_scores, top_index
+
+
+def _occurrence_rank(values):
+    '''
+    For each position, the number of previous positions holding the same value
+    '''
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    group_starts = np.repeat(starts, np.diff(np.r_[starts, len(values)]))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[order] = np.arange(len(values)) - group_starts
+    return rank
+
+
+def holdout_edges(edges, node_size, drop_percent):
+    '''
+    Choose edges to remove, in a random order, so that every node keeps degree >= 1.
+    Each bulk pass keeps the candidate edges whose endpoints both have degree >= 2, then accepts an edge when, at both
+    endpoints, fewer candidates come before it than the node can lose (degree - 1). So accepted edges never isolate a
+    node even if all earlier candidates are accepted too. Rejected edges are retried in the next pass with the updated
+    degrees.
+    :param edges: int array (E, 2), each undirected edge once
+    :param node_size:
+    :param drop_percent: stop when this fraction of the edges is removed
+    :return: bool mask of the removed edges
+    '''
+    edges_len = len(edges)
+    degree = np.bincount(edges.ravel(), minlength=node_size)
+    target = int(np.ceil(drop_percent * edges_len))
+    if target > 0 and (target - 1) / edges_len >= drop_percent:
+        target -= 1
+
+    removed = np.zeros(edges_len, dtype=bool)
+    removed_count = 0
+    candidates = np.random.permutation(edges_len)
+    while removed_count < target and len(candidates) > 0:
+        u, v = edges[candidates, 0], edges[candidates, 1]
+        # Degrees only decrease, so edges failing this check are never removable. A self-loop counts twice.
+        removable = (degree[u] >= 2) & (degree[v] >= 2) & ((u != v) | (degree[u] >= 3))
+        candidates = candidates[removable]
+        if len(candidates) == 0:
+            break
 
-# https://www.analyticsvidhya.com/blog/2020/01/link-prediction-how-to-predict-your-future-connections-on-facebook/
-def preprocessing_graph_for_link_prediction(G: nx.Graph, k_length=2, drop_node_percent=1, seed=6, edge_rate=None):
-    np.random.seed(seed)
-    print("Pre-processing graph for link prediction...")
-    start_time = time()
+        ends = edges[candidates]
+        rank = _occurrence_rank(ends.ravel()).reshape(-1, 2)
+        accepted = np.all(rank < degree[ends] - 1, axis=1)
+
+        chosen = candidates[accepted][:target - removed_count]
+        removed[chosen] = True
+        removed_count += len(chosen)
+        degree -= np.bincount(edges[chosen].ravel(), minlength=node_size)
+        candidates = candidates[~accepted]
+    return removed
+
+
+def split_link_prediction_data(A, k_length=2, drop_node_percent=1, edge_rate=None):
+    '''
+    Hold out edges of a graph for link prediction
+    :param A: adjacency matrix in scipy sparse format (symmetric)
+    :param k_length: max distance between two nodes of a negative pair
+    :param drop_node_percent: fraction of the edges to hold out
+    :param edge_rate: if provided, negative pairs are sampled so that positive / (positive + negative) ~ edge_rate
+    :return: positive pairs (u, v), negative pairs (u, v) as int32 arrays of row indices, and the reduced csr graph
+    '''
+    A = sparse.csr_matrix(A)
+    node_size = A.shape[0]
 
     # Drop some edges which not make graph isolate
     print("\tDrop some current links...", end=" ")
     temp_time = time()
-
-    initial_nodes_len = G.number_of_nodes()
-    initial_edges_len = G.number_of_edges()
-    dropped_node_count = 0
-    G_partial = G.copy()
-    omissible_links = []
-    initial_edges = list(G.edges)
-    np.random.shuffle(initial_edges)
-
-    for u, v in tqdm(initial_edges):
-        if (dropped_node_count / initial_edges_len) >= drop_node_percent:
-            break
-        if G_partial.degree[u] < 2 or G_partial.degree[v] < 2:
-            continue
-        G_partial.remove_edge(u, v)
-        if G_partial.number_of_nodes() != G.number_of_nodes():
-            print("Delete wrong egde: {} {}".format(u, v))
-            G_partial.add_edge(u, v)
-        # TODO: Check connected component
-        # if nx.number_connected_components(G_partial) == 1 and G_partial.number_of_nodes() == initial_nodes_len:
-        omissible_links.append({
-            'node_1': u,
-            'node_2': v
-        })
-        dropped_node_count += 1
-
-    assert G_partial.number_of_nodes() == G.number_of_nodes()
-
-    # create data frame of removable edges
-    removed_edge_graph_df = pd.DataFrame(data=omissible_links, columns=['node_1', 'node_2'])
-    removed_edge_graph_df['link'] = 1  # add the target variable 'link'
+    upper = sparse.triu(A, format='coo')
+    edges = np.vstack((upper.row, upper.col)).T.astype(np.int64)
+    removed = holdout_edges(edges, node_size=node_size, drop_percent=drop_node_percent)
+    pos_u, pos_v = edges[removed, 0].astype(np.int32), edges[removed, 1].astype(np.int32)
+
+    kept = ~removed
+    kept_u, kept_v, kept_data = upper.row[kept], upper.col[kept], upper.data[kept]
+    off_diagonal = kept_u != kept_v
+    A_partial = sparse.csr_matrix(
+        (np.r_[kept_data, kept_data[off_diagonal]],
+         (np.r_[kept_u, kept_v[off_diagonal]], np.r_[kept_v, kept_u[off_diagonal]])),
+        shape=A.shape
+    )
     print(f"{round(time() - temp_time)}s")
 
-    # print("Random drop some unconnected link")
-    # print("Before drop length graph_df = ", len(graph_df))
-    # remove_n = max(len(graph_df) - len(removed_edge_graph_df) * 9, 0)
-    # drop_indices = np.random.choice(graph_df.index, remove_n, replace=False)
-    # graph_df = graph_df.drop(drop_indices)
-    # print("After drop length graph_df = ", len(graph_df))
-
     # Get possible edge can form in the future
     temp_time = time()
     print("\tGet possible unconnected link...", end=" ")
+    n_limit = None
     if edge_rate is not None:
-        expect_unconnected_links_len = int(len(removed_edge_graph_df) * (1 - edge_rate) / edge_rate)
-        all_unconnected_pairs = get_unconnected_pairs_(G, cutoff=k_length, n_limit=expect_unconnected_links_len)
-    else:
-        all_unconnected_pairs = get_unconnected_pairs_(G, cutoff=k_length)
-
-    graph_df = pd.DataFrame(data=all_unconnected_pairs, columns=['node_1', 'node_2'])
-    graph_df['link'] = 0  # add target variable 'link'
+        n_limit = int(len(pos_u) * (1 - edge_rate) / edge_rate)
+    neg_u, neg_v = get_unconnected_index_pairs(A, cutoff=k_length, n_limit=n_limit)
     print(f"{round(time() - temp_time)}s")
 
-    print("Rate: ", len(removed_edge_graph_df) / len(graph_df))
+    print("Rate: ", len(pos_u) / len(neg_u))
+    return (pos_u, pos_v), (neg_u, neg_v), A_partial
+
+
+# https://www.analyticsvidhya.com/blog/2020/01/link-prediction-how-to-predict-your-future-connections-on-facebook/
+def preprocessing_graph_for_link_prediction(G: nx.Graph, k_length=2, drop_node_percent=1, seed=6, edge_rate=None):
+    np.random.seed(seed)
+    print("Pre-processing graph for link prediction...")
+    start_time = time()
+
+    nodes = np.array(sorted(G.nodes()))
+    A = nx.to_scipy_sparse_matrix(G, nodelist=nodes, format='csr')
+    (pos_u, pos_v), (neg_u, neg_v), _ = split_link_prediction_data(A, k_length=k_length,
+                                                                    drop_node_percent=drop_node_percent,
+                                                                    edge_rate=edge_rate)
+    pos_u, pos_v, neg_u, neg_v = nodes[pos_u], nodes[pos_v], nodes[neg_u], nodes[neg_v]
+
+    G_partial = G.copy()
+    G_partial.remove_edges_from(zip(pos_u.tolist(), pos_v.tolist()))
+    assert G_partial.number_of_nodes() == G.number_of_nodes()
 
     print("\tCreate data frame have potential links and removed link.")
-    graph_df = graph_df.append(removed_edge_graph_df[['node_1', 'node_2', 'link']], ignore_index=True)
+    graph_df = pd.DataFrame({
+        'node_1': np.r_[neg_u, pos_u],
+        'node_2': np.r_[neg_v, pos_v],
+        'link': np.r_[np.zeros(len(neg_u), dtype=int), np.ones(len(pos_u), dtype=int)]
+    })
     graph_df = graph_df.astype(int)
 
     print(f"Processed graph in {round(time() - start_time, 2)}s")
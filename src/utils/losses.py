@@ -0,0 +1,33 @@
+import torch
+
+
+def first_order_loss(Y, edge_index, edge_weight):
+    '''
+    First-order proximity loss: sum of w_ij * ||y_i - y_j||^2 over the edges (i, j).
+    With a symmetric adjacency A (both directions of each edge are listed) it equals 2 * trace(Y^T L Y), L = D - A,
+    but costs O(|E| * d) instead of O(N^2 * d).
+    :param Y: embedding of the batch, shape (n, d)
+    :param edge_index: long tensor of shape (2, |E|), indices are rows of Y
+    :param edge_weight: tensor of shape (|E|,)
+    :return:
+    '''
+    diff = Y[edge_index[0]] - Y[edge_index[1]]
+    return torch.sum(edge_weight * torch.sum(diff * diff, dim=1))
+
+
+def second_order_loss(X_hat, x_index, x_value, beta):
+    '''
+    Weighted reconstruction loss: sum(((X_hat - X) * B)^2) with B_ij = beta where X_ij != 0 and B_ij = 1 elsewhere.
+    The penalty is applied from the non-zero entries of X only, so no dense X, B or (X_hat - X) is allocated:
+        sum(X_hat^2) - sum_nz(X_hat_ij^2) + beta^2 * sum_nz((X_hat_ij - X_ij)^2)
+    Gradients are the same as the dense form.
+    :param X_hat: reconstruction of the batch, shape (n, N)
+    :param x_index: long tensor of shape (2, nnz), positions of the non-zero entries of X
+    :param x_value: tensor of shape (nnz,), values of the non-zero entries of X
+    :param beta: penalty on the non-zero entries
+    :return:
+    '''
+    flat = X_hat.reshape(-1)
+    x_hat_nz = X_hat[x_index[0], x_index[1]]
+    diff_nz = x_hat_nz - x_value
+    return torch.dot(flat, flat) - torch.dot(x_hat_nz, x_hat_nz) + beta ** 2 * torch.dot(diff_nz, diff_nz)
@@ -17,24 +17,12 @@ from src.utils.setting_param import SettingParam
 warnings.filterwarnings("ignore")
 
 from src.dyn_ge import TDynGE
-from src.utils.link_prediction import run_link_pred_evaluate
-
-
-def create_dump_models(dy_ge: TDynGE, weight_model_folder):
-    '''
-    Method to create saved model on disk for later optimizer
-    :return:
-    '''
-    dy_ge.train(epochs=1, skip_print=1, learning_rate=1e-7,
-                folder_path=weight_model_folder)
+from src.utils.link_prediction import run_link_pred_evaluate, run_predict_top_k, top_k_prediction_edges
 
 
 def train_model(dy_ge: TDynGE, params: SettingParam):
     print("\n-----------\nStart total training...")
 
-    print("Creating model saving for each graph...")
-    create_dump_models(dy_ge, weight_model_folder=params.dyge_weight_folder)
-
     print("\n### ==\tOptimize model training == ###")
 
     start_time_train = time()
@@ -42,12 +30,13 @@ def train_model(dy_ge: TDynGE, params: SettingParam):
         print(f"\n==========\t Model index = {model_idx} ============")
         train_model_at_index(dy_ge=dy_ge, params=params, model_idx=model_idx)
 
+    dy_ge.wait_for_saving()
     print(f"\nFinish total training: {round(time() - start_time_train, 2)}s\n--------------\n")
 
 
 def train_model_at_index(dy_ge: TDynGE, params: SettingParam, model_idx=None):
     '''
-    TODO: Should support for resuming train which continue train with learning_rate
+    Train a model with the whole learning_rate_list in one optimizer (see TStaticGE.train)
     :return:
     '''
     print(f"\n==========\t Model index = {params.specific_dyge_model_index} ============")
@@ -56,34 +45,32 @@ def train_model_at_index(dy_ge: TDynGE, params: SettingParam, model_idx=None):
     if model_idx is None:
         model_idx = params.specific_dyge_model_index
 
-    for i, lr in enumerate(params.learning_rate_list):
-        is_load_from_previous_model = False
-        if not params.dyge_resume_training and i == 0:
-            is_load_from_previous_model = True  # Prevent re-train model
-        print("\tLearning rate = ", lr)
-        training_time = dy_ge.train_at(
-            model_index=model_idx,
-            learning_rate=lr,
-            prop_size=params.prop_size, epochs=params.epochs, skip_print=params.skip_print,
-            net2net_applied=params.net2net_applied,
-            batch_size=params.batch_size, folder_path=params.dyge_weight_folder,
-            ck_config=CheckpointConfig(number_saved=params.ck_length_saving,
-                                       folder_path=params.ck_folder),
-            early_stop=params.early_stop,
-            is_load_from_previous_model=is_load_from_previous_model,
-            shuffle=params.dyge_shuffle
-        )
-        print(f"Train model of graph {model_idx} in {training_time}s\n")
+    print("\tLearning rates = ", params.learning_rate_list)
+    training_time = dy_ge.train_at(
+        model_index=model_idx,
+        learning_rate=params.learning_rate_list,
+        lr_schedule=params.lr_schedule if params.lr_schedule is not None else 'piecewise',
+        prop_size=params.prop_size, epochs=params.epochs, skip_print=params.skip_print,
+        net2net_applied=params.net2net_applied,
+        batch_size=params.batch_size, folder_path=params.dyge_weight_folder,
+        ck_config=CheckpointConfig(number_saved=params.ck_length_saving,
+                                   folder_path=params.ck_folder,
+                                   interval_seconds=params.ck_interval_seconds),
+        early_stop=params.early_stop,
+        is_load_from_previous_model=not params.dyge_resume_training,
+        shuffle=params.dyge_shuffle
+    )
+    print(f"Train model of graph {model_idx} in {training_time}s\n")
 
     print(f"\nFinish total training: {round(time() - start_time_train, 2)}s\n--------------\n")
 
 
-def check_current_loss_model(graphs, dy_ge: TDynGE, weight_model_folder):
+def check_current_loss_model(dy_ge: TDynGE, workers=None):
     print("\nCheck current loss model")
-    for model_idx in range(dy_ge.size):
-        dy_ge.train_at(model_index=model_idx, folder_path=weight_model_folder,
-                       epochs=1, learning_rate=1e-8,
-                       is_load_from_previous_model=False, batch_size=min(8192, graphs[model_idx].number_of_nodes()))
+    losses = dy_ge.evaluate_losses(workers=workers)
+    for model_idx, loss in enumerate(losses):
+        print(f"Graph {model_idx}: loss_1={loss['loss_1']:.4f}\tloss_2={loss['loss_2']:.4f}\tloss={loss['loss']:.4f}")
+    return losses
 
 
 def dyngem_alg(graphs, params: SettingParam):
@@ -95,7 +82,7 @@ def dyngem_alg(graphs, params: SettingParam):
     )
     if params.is_load_dyge_model:
         print("\n-----------\nStart load model...")
-        dy_ge.load_models(folder_path=params.dyge_weight_folder)
+        dy_ge.load_models(folder_path=params.dyge_weight_folder, index=params.specific_dyge_model_index)
         if params.specific_dyge_model_index is not None:
             train_model_at_index(dy_ge, params)
             print("AP: ", reconstruction_precision_k(graph=graphs[params.is_load_dyge_model],
@@ -106,7 +93,7 @@ def dyngem_alg(graphs, params: SettingParam):
     dy_ge.save_embeddings(folder_path=params.dyge_emb_folder)
 
     if params.show_loss:
-        check_current_loss_model(graphs, dy_ge, weight_model_folder=params.dyge_weight_folder)
+        check_current_loss_model(dy_ge)
 
     dy_embeddings = dy_ge.get_all_embeddings()
 
@@ -147,7 +134,7 @@ def sdne_alg(graphs, params: SettingParam, index=None):
     def _sdne_train():
         print(f"[{i}] SDNE train model...")
         ck_point = CheckpointConfig(number_saved=params.ck_length_saving, folder_path=params.sdne_weight_folder + "_ck",
-                                    index=i)
+                                    index=i, interval_seconds=params.ck_interval_seconds)
         ge.train(
             batch_size=params.batch_size, epochs=params.epochs, skip_print=params.skip_print,
             learning_rate=params.sdne_learning_rate, early_stop=params.early_stop,
@@ -182,29 +169,47 @@ def sdne_alg(graphs, params: SettingParam, index=None):
                            beta=params.beta, activation=params.sdne_activation)
             _sdne_train()
 
-        ge.save_embedding(filepath=join(params.sdne_emb_folder, f"_{i}"))
+        ge.save_embedding(folder_path=params.sdne_emb_folder, index=i)
         save_custom_model(model=ge.get_model(), filepath=sdne_model_path)
 
         dy_embeddings.append(ge.get_embedding())
     return dy_embeddings
 
 
-def link_pred_eva(g_hidden_df, hidden_dy_embedding):
+def link_pred_eva(g_hidden_df, hidden_dy_embedding, cache_folder=None, top_k=None, g_hidden_partial=None,
+                  idx2node=None, show_acc_on_edge=False):
+    '''
+    Train and evaluate the link prediction model, then predict the top_k most likely links among the pairs without
+    link. Pairs are scored batch by batch and only the running top_k is kept (see run_predict_top_k).
+    :param g_hidden_df: DataFrame [node_1, node_2, link]
+    :param hidden_dy_embedding:
+    :param cache_folder:
+    :param top_k: number of predicted links to report. None to skip the prediction
+    :param g_hidden_partial:
+    :param idx2node: to print the predicted links with the original node ids
+    :param show_acc_on_edge:
+    :return: top_k predicted edges and their scores, or None
+    '''
     # ----- run evaluate link prediction -------
 
     print(f"\n-->Run link predict evaluation ---")
     link_pred_model = run_link_pred_evaluate(
         graph_df=g_hidden_df,
         embeddings=hidden_dy_embedding,
-        num_boost_round=20000
+        num_boost_round=20000,
+        cache_folder=cache_folder
     )
+    if top_k is None:
+        return None
+
     possible_edges_df = g_hidden_df[g_hidden_df['link'] == 0]
-    # y_pred = run_predict(data=possible_edges_df, embedding=hidden_dy_embedding, model=link_pred_model)
-    # top_k_edges = top_k_prediction_edges(
-    #     G=g_hidden_partial, y_pred=y_pred, possible_edges_df=possible_edges_df,
-    #     top_k=top_k, show_acc_on_edge=show_acc_on_edge,
-    #     plot_link_pred=False, limit_node=25
-    # )
+    top_scores, top_index = run_predict_top_k(data=possible_edges_df, embedding=hidden_dy_embedding,
+                                              model=link_pred_model, top_k=top_k)
+    return top_k_prediction_edges(
+        G=g_hidden_partial, y_pred=top_scores, possible_edges_df=possible_edges_df,
+        top_k=top_k, show_acc_on_edge=show_acc_on_edge, plot_link_pred=False, limit_node=25,
+        idx2node=idx2node, top_index=top_index
+    )
 
 
 def create_folder(folder_path):
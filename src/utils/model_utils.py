@@ -71,17 +71,86 @@ def save_custom_model(model: TAutoencoder, filepath, checkpoint=None, compress=T
     # if not exists(folder_fpath):
     #     os.makedirs(folder_path)
 
+    save_model_state(state_dict=model.state_dict(), config_layer=model.get_config_layer(), filepath=filepath)
+
+
+def get_cpu_state_dict(model: TAutoencoder):
+    '''
+    Copy of the model weights on CPU, safe to save while the model keeps training
+    '''
+    return {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}
+
+
+def save_model_state(state_dict, config_layer, filepath):
+    '''
+    Write filepath.pt and filepath.json of a model. Files are written to temporary files first and moved in place,
+    so a reader never loads a partial model.
+    :param state_dict:
+    :param config_layer: TAutoencoder.get_config_layer()
+    :param filepath:
+    :return:
+    '''
     folder_path = filepath[:filepath.rfind('/')]
-    if not exists(folder_path):
-        os.makedirs(folder_path)
+    if folder_path and not exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
 
     model_path = filepath + ".pt"
-    torch.save(model.state_dict(), model_path)
+    torch.save(state_dict, model_path + ".tmp")
+    os.replace(model_path + ".tmp", model_path)
 
-    config_layer = model.get_config_layer()
     config_path = filepath + ".json"
-    with open(config_path, 'w') as fi:
+    with open(config_path + ".tmp", 'w') as fi:
         json.dump(config_layer, fi, indent=2)
+    os.replace(config_path + ".tmp", config_path)
+
+
+def to_cpu(obj):
+    '''
+    Copy of the tensors of a (nested) state on CPU, e.g. an optimizer state_dict. Other values are kept as they are.
+    '''
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def save_checkpoint(checkpoint, filepath):
+    '''
+    Write a training checkpoint (see TStaticGE.train) to a temporary file and move it in place, so the previous
+    checkpoint stays valid until the new one is complete.
+    :param checkpoint: dict of CPU tensors and python values
+    :param filepath:
+    :return:
+    '''
+    folder_path = os.path.dirname(filepath)
+    if folder_path and not exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+    torch.save(checkpoint, filepath + ".tmp")
+    os.replace(filepath + ".tmp", filepath)
+
+
+def load_checkpoint(filepath):
+    '''
+    :param filepath:
+    :return: checkpoint saved by save_checkpoint, or None if there is no checkpoint
+    '''
+    if not exists(filepath):
+        return None
+    return torch.load(filepath, map_location='cpu')
+
+
+def create_model(config_layer):
+    return TAutoencoder(
+        input_dim=config_layer['input_dim'],
+        embedding_dim=config_layer['embedding_dim'],
+        hidden_dims=config_layer['hidden_dims'],
+        l1=config_layer['l1'],
+        l2=config_layer['l2'],
+        activation=config_layer['activation']
+    )
 
 
 def load_custom_model(filepath):
@@ -90,14 +159,7 @@ def load_custom_model(filepath):
     with open(config_path) as fo:
         config_layer = json.load(fo)
 
-    model = TAutoencoder(
-        input_dim=config_layer['input_dim'],
-        embedding_dim=config_layer['embedding_dim'],
-        hidden_dims=config_layer['hidden_dims'],
-        l1=config_layer['l1'],
-        l2=config_layer['l2'],
-        activation=config_layer['activation']
-    )
+    model = create_model(config_layer)
 
     model_path = filepath + ".pt"
     model.load_state_dict(torch.load(model_path, map_location=device))
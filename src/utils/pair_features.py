@@ -0,0 +1,86 @@
+import numpy as np
+
+PAIR_OPERATORS = ['sum', 'hadamard', 'l1', 'l2', 'concat']
+
+
+def get_feature_dim(embedding_dim, operator='sum'):
+    if operator not in PAIR_OPERATORS:
+        raise ValueError(f"operator={operator} is invalid. Must be one of {PAIR_OPERATORS}")
+    if operator == 'concat':
+        return 2 * embedding_dim
+    return embedding_dim
+
+
+def embedding_from_keyed_vectors(keyed_vectors, u, v):
+    '''
+    Node2Vec embeddings are keyed by str(node). Gather the vectors of the nodes in the pairs once and re-index the
+    pairs on the gathered matrix.
+    :param keyed_vectors: mapping str(node) -> vector
+    :param u:
+    :param v:
+    :return: embedding matrix, u, v
+    '''
+    nodes, inverse = np.unique(np.concatenate((u, v)), return_inverse=True)
+    embedding = np.array([keyed_vectors[str(node)] for node in nodes], dtype=np.float32)
+    return embedding, inverse[:len(u)], inverse[len(u):]
+
+
+def iter_pair_features(embedding, u, v, operator='sum', chunk_size=65536):
+    '''
+    Features of node pairs, chunk by chunk. Embedding rows are gathered with fancy indexing into preallocated
+    float32 blocks, so no per-pair Python object is created.
+    NOTE: the yielded block is reused by the next chunk. Copy it if it must outlive the iteration.
+    :param embedding: array (N, d)
+    :param u: node indices of the first nodes of the pairs
+    :param v: node indices of the second nodes of the pairs
+    :param operator: 'sum' | 'hadamard' | 'l1' | 'l2' | 'concat'
+    :param chunk_size: number of pairs per chunk
+    :return: start index of the chunk and its features, float32 array (chunk, feature_dim)
+    '''
+    embedding = np.asarray(embedding, dtype=np.float32)
+    u = np.asarray(u)
+    v = np.asarray(v)
+    embedding_dim = embedding.shape[1]
+    feature_dim = get_feature_dim(embedding_dim, operator)
+
+    chunk_size = max(1, min(chunk_size, len(u)))
+    left = np.empty((chunk_size, embedding_dim), dtype=np.float32)
+    right = np.empty((chunk_size, embedding_dim), dtype=np.float32)
+    features = np.empty((chunk_size, feature_dim), dtype=np.float32)
+
+    for start in range(0, len(u), chunk_size):
+        end = min(start + chunk_size, len(u))
+        size = end - start
+        out = features[:size]
+        if operator == 'concat':
+            np.take(embedding, u[start:end], axis=0, out=out[:, :embedding_dim])
+            np.take(embedding, v[start:end], axis=0, out=out[:, embedding_dim:])
+            yield start, out
+            continue
+
+        a = np.take(embedding, u[start:end], axis=0, out=left[:size])
+        b = np.take(embedding, v[start:end], axis=0, out=right[:size])
+        if operator == 'sum':
+            np.add(a, b, out=out)
+        elif operator == 'hadamard':
+            np.multiply(a, b, out=out)
+        elif operator == 'l1':
+            np.subtract(a, b, out=out)
+            np.abs(out, out=out)
+        else:  # operator == 'l2'
+            np.subtract(a, b, out=out)
+            np.square(out, out=out)
+        yield start, out
+
+
+def build_pair_features(embedding, u, v, operator='sum', chunk_size=65536, out=None):
+    '''
+    Features of all node pairs. See iter_pair_features.
+    :param out: optional preallocated float32 array (len(u), feature_dim), e.g. a memory-mapped array
+    :return:
+    '''
+    if out is None:
+        out = np.empty((len(u), get_feature_dim(np.shape(embedding)[1], operator)), dtype=np.float32)
+    for start, features in iter_pair_features(embedding, u, v, operator=operator, chunk_size=chunk_size):
+        out[start:start + len(features)] = features
+    return out
@@ -1,5 +1,8 @@
 import numpy as np
 import networkx as nx
+from scipy import sparse
+
+from src.utils.graph_util import graph_to_csr
 
 
 def get_similarity(result):
@@ -18,42 +21,123 @@ def dyge_reconstruction_evaluation(graphs, dy_embeddings,
     print("mAP: ", sum_AP / len(graphs))
 
 
+def _block_entries(csc_rows, c0, c1):
+    '''
+    Entries of a block of rows in the columns [c0, c1)
+    :param csc_rows: rows of a sparse matrix in csc format
+    :return: rows and columns local to the block
+    '''
+    start, end = csc_rows.indptr[c0], csc_rows.indptr[c1]
+    rows = csc_rows.indices[start:end]
+    cols = np.repeat(np.arange(c1 - c0), np.diff(csc_rows.indptr[c0:c1 + 1]))
+    return rows, cols
+
+
+def _merge_top_k(top, tile, r0, c0, k):
+    '''
+    Merge the k largest entries of a similarity tile into the running top k pairs
+    :param top: (scores, u, v) of the current top pairs
+    :return: updated (scores, u, v), not sorted
+    '''
+    scores, u, v = top
+    flat = tile.ravel()
+    kth = scores.min() if len(scores) >= k else -np.inf
+    candidates = np.flatnonzero(flat > kth)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-flat[candidates], k - 1)[:k]]
+
+    scores = np.concatenate((scores, flat[candidates]))
+    u = np.concatenate((u, candidates // tile.shape[1] + r0))
+    v = np.concatenate((v, candidates % tile.shape[1] + c0))
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, u, v = scores[keep], u[keep], v[keep]
+    return scores, u, v
+
+
+def rank_similarity_pairs(embedding, true_adj, max_k, hit_limit=None, exclude_adj=None, block_size=2048):
+    '''
+    Rank every ordered pair (u, v), u != v and not in exclude_adj, by the similarity embedding[u] . embedding[v] without building the N x N
+    similarity matrix. Similarities are computed tile by tile, memory is O(block_size^2).
+    The rank of the h-th best true pair is h plus the number of other pairs with a higher similarity, counted in each
+    tile against the similarities of the true pairs.
+    :param embedding: array (N, d)
+    :param true_adj: scipy sparse matrix (N x N), non-zero entries are the true pairs
+    :param max_k: length of the head of the ranking
+    :param hit_limit: number of best true pairs whose rank is computed. Default is all true pairs
+    :param exclude_adj: scipy sparse matrix (N x N), non-zero entries are skipped by the ranking (e.g. known edges).
+        Must not overlap true_adj
+    :param block_size:
+    :return: hits (bool array, whether each of the max_k best pairs is a true pair, in rank order)
+        and hit_ranks (1-based ranks of the hit_limit best true pairs)
+    '''
+    embedding = np.asarray(embedding)
+    node_size = embedding.shape[0]
+    true_adj = sparse.csr_matrix(true_adj)
+    if exclude_adj is not None:
+        exclude_adj = sparse.csr_matrix(exclude_adj)
+
+    true_pairs = true_adj.tocoo()
+    off_diagonal = true_pairs.row != true_pairs.col
+    true_u, true_v = true_pairs.row[off_diagonal], true_pairs.col[off_diagonal]
+    true_scores = np.einsum('ij,ij->i', embedding[true_u], embedding[true_v])
+    # Similarities of the best true pairs in ascending order
+    thresholds = np.sort(true_scores)[::-1][:hit_limit][::-1]
+    count_bins = np.zeros(len(thresholds) + 1, dtype=np.int64)
+
+    top = (np.empty(0, dtype=embedding.dtype), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    for r0 in range(0, node_size, block_size):
+        r1 = min(r0 + block_size, node_size)
+        true_rows = true_adj[r0:r1].tocsc()
+        exclude_rows = exclude_adj[r0:r1].tocsc() if exclude_adj is not None else None
+        for c0 in range(0, node_size, block_size):
+            c1 = min(c0 + block_size, node_size)
+            tile = np.dot(embedding[r0:r1], embedding[c0:c1].T)
+            if r0 == c0:
+                np.fill_diagonal(tile, -np.inf)
+            if exclude_rows is not None:
+                rows, cols = _block_entries(exclude_rows, c0, c1)
+                tile[rows, cols] = -np.inf
+
+            if max_k > 0:
+                top = _merge_top_k(top, tile, r0, c0, max_k)
+
+            if len(thresholds) > 0:
+                rows, cols = _block_entries(true_rows, c0, c1)
+                tile[rows, cols] = -np.inf
+                values = tile[tile > thresholds[0]]
+                count_bins += np.bincount(np.searchsorted(thresholds, values, side='left'),
+                                          minlength=len(thresholds) + 1)
+            del tile
+
+    scores, top_u, top_v = top
+    order = np.argsort(-scores, kind='stable')
+    top_u, top_v = top_u[order], top_v[order]
+    hits = np.asarray(true_adj[top_u, top_v]).ravel() != 0 if len(order) > 0 else np.zeros(0, dtype=bool)
+
+    # Number of other pairs with a higher similarity than each threshold, then in descending order
+    count_greater = (count_bins.sum() - np.cumsum(count_bins))[:len(thresholds)][::-1]
+    hit_ranks = count_greater + np.arange(1, len(thresholds) + 1)
+    return hits, hit_ranks
+
+
+def _precision_k_and_ap(hits, hit_ranks, true_size):
+    prec_k_list = list(np.cumsum(hits) / np.arange(1, len(hits) + 1))
+    AP = np.sum(np.arange(1, len(hit_ranks) + 1) / hit_ranks) / true_size
+    return prec_k_list, AP
+
+
 def reconstruction_precision_k(embedding, graph: nx.Graph,
-                               k_query=None):
+                               k_query=None, block_size=2048):
     if k_query is None:
         k_query = [1, 2, 10, 20, 100, 200, 1000, 2000, 4000, 6000, 8000, 10000]
 
     def get_precisionK(max_index):
-        similarity = get_similarity(embedding).reshape(-1)
-        sortedInd = np.argsort(similarity)[::-1]
-        K = 0
-        true_pred_count = 0
-        prec_k_list = []
-        node_size = graph.number_of_nodes()
-
         true_size_edges = graph.number_of_edges()
-        precision_list = []
-
-        for ind in sortedInd:
-            u = ind // node_size
-            v = ind % node_size
-            if u == v:
-                continue
-
-            K += 1
-            if graph.has_edge(u, v):
-                true_pred_count += 1
-                if true_pred_count <= true_size_edges:
-                    precision_list.append(true_pred_count / K)
-
-            if K <= max_index:
-                prec_k_list.append(true_pred_count / K)
-
-            if true_pred_count > true_size_edges and K > max_index:
-                break
-
-        AP = np.sum(precision_list) / true_size_edges
-        return prec_k_list, AP
+        true_adj = graph_to_csr(graph, node_size=embedding.shape[0])
+        hits, hit_ranks = rank_similarity_pairs(embedding, true_adj=true_adj, max_k=max_index,
+                                                hit_limit=true_size_edges, block_size=block_size)
+        return _precision_k_and_ap(hits, hit_ranks, true_size_edges)
 
     print('\nReconstruction Precision K')
     precisionK_list, AP = get_precisionK(np.max(k_query))
@@ -64,42 +148,23 @@ def reconstruction_precision_k(embedding, graph: nx.Graph,
     return k_query_res, AP
 
 
-def check_link_predictionK(embedding, train_graph: nx.Graph, origin_graph: nx.Graph, k_query):
+def check_link_predictionK(embedding, train_graph: nx.Graph, origin_graph: nx.Graph, k_query, block_size=2048):
     def get_precisionK(max_index):
         print("\nGet Precision@K ...")
-        similarity = get_similarity(embedding).reshape(-1)
-        sortedInd = np.argsort(similarity)[::-1]
-        true_pred_count = 0
-        K = 0
-        prec_k_list = []
-        node_size = train_graph.number_of_nodes()
-
+        node_size = embedding.shape[0]
         removed_links_size = origin_graph.number_of_edges() - train_graph.number_of_edges()
-        precision_list = []
-
-        for ind in sortedInd:
-            u = ind // node_size
-            v = ind % node_size
-            # Only check removed link from origin graph.
-            if u == v or train_graph.has_edge(u, v):
-                continue
-            # print(similarity[ind])
-
-            K += 1
-            # This mean train_graph can be predict u and v has a link.
-            if origin_graph.has_edge(u, v):
-                true_pred_count += 1
-                if true_pred_count <= removed_links_size:
-                    precision_list.append(true_pred_count / K)
-
-            if K <= max_index:
-                prec_k_list.append(true_pred_count / K)
-
-            if true_pred_count > removed_links_size and K > max_index:
-                break
+
+        # Only rank pairs which are not links of train_graph. Hits are the links removed from origin graph.
+        train_adj = graph_to_csr(train_graph, node_size=node_size)
+        origin_adj = graph_to_csr(origin_graph, node_size=node_size)
+        removed_adj = origin_adj - origin_adj.multiply(train_adj)
+        removed_adj.eliminate_zeros()
+
+        hits, hit_ranks = rank_similarity_pairs(embedding, true_adj=removed_adj, max_k=max_index,
+                                                hit_limit=removed_links_size, exclude_adj=train_adj,
+                                                block_size=block_size)
         # Due to only one query Q = 1
-        AP = np.sum(precision_list) / removed_links_size
-        return prec_k_list, AP
+        return _precision_k_and_ap(hits, hit_ranks, removed_links_size)
 
     precisionK_list, AP = get_precisionK(np.max(k_query))
     k_query_res = []
@@ -12,7 +12,9 @@ class SettingParam(object):
 
         #  folder_paths
         self.dataset_folder = None
+        self.compiled_dataset_folder = None
         self.processed_link_pred_data_folder = None
+        self.link_pred_cache_folder = None
         self.dyge_weight_folder = None
         self.dyge_emb_folder = None
 
@@ -34,12 +36,14 @@ class SettingParam(object):
         self.batch_size = None
         self.early_stop = None
         self.learning_rate_list = None
+        self.lr_schedule = None
         self.alpha = None
         self.beta = None
         self.l1 = None
         self.l2 = None
         self.net2net_applied = None
         self.ck_length_saving = None  # Check point
+        self.ck_interval_seconds = None
         self.ck_folder = None
         self.dyge_shuffle = None
         self.dyge_resume_training = None
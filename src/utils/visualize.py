@@ -1,6 +1,7 @@
 from os.path import join
 from time import time
 import numpy as np
+from scipy import sparse
 import matplotlib.pyplot as plt
 from sklearn.manifold import TSNE
 import networkx as nx
@@ -60,6 +61,13 @@ def plot_embedding(embeddings):
 
 
 def plot_reconstruct_graph(reconstructed_graph, threshold=0.5, pos=None):
+    if sparse.issparse(reconstructed_graph):
+        g = reconstructed_graph.tocsr(copy=True)
+        g.data = (g.data >= threshold).astype(np.float32)
+        g.eliminate_zeros()
+        draw_graph(g=nx.from_scipy_sparse_matrix(g), pos=pos)
+        return
+
     g = np.zeros_like(reconstructed_graph)
     g[reconstructed_graph >= threshold] = 1.0
     draw_graph(g=nx.from_numpy_array(g), pos=pos)
@@ -0,0 +1,65 @@
+from os import listdir
+from os.path import exists, join
+
+import networkx as nx
+import pytest
+
+from src.dyn_ge import TDynGE
+from src.utils.checkpoint_config import CheckpointConfig
+
+
+class InterruptedTraining(Exception):
+    pass
+
+
+class InterruptingCheckpointConfig(CheckpointConfig):
+    '''
+    Interrupt the training of a snapshot after a number of epochs, as a crash would
+    '''
+
+    def __init__(self, interrupt_index, interrupt_epoch, **kwargs):
+        super(InterruptingCheckpointConfig, self).__init__(**kwargs)
+        self.interrupt_index = interrupt_index
+        self.interrupt_epoch = interrupt_epoch
+
+    def is_due(self, epoch, seconds_since_saved):
+        if self.Index == self.interrupt_index and epoch == self.interrupt_epoch:
+            raise InterruptedTraining()
+        return super(InterruptingCheckpointConfig, self).is_due(epoch, seconds_since_saved)
+
+
+def _train_kwargs(ck_config):
+    return dict(prop_size=0.3, batch_size=16, epochs=6, skip_print=100, learning_rate=0.01, early_stop=100,
+                plot_loss=False, shuffle=True, ck_config=ck_config)
+
+
+def test_resume_series_interrupted_in_snapshot_1(tmp_path, capsys):
+    graphs = [nx.gnm_random_graph(n=20 + 10 * i, m=60 + 30 * i, seed=i) for i in range(3)]
+    model_folder = str(tmp_path / "models")
+    ck_folder = str(tmp_path / "ck")
+
+    dy_ge = TDynGE(graphs=graphs, embedding_dim=4)
+    ck_config = InterruptingCheckpointConfig(interrupt_index=1, interrupt_epoch=5, number_saved=2,
+                                             folder_path=ck_folder)
+    with pytest.raises(InterruptedTraining):
+        dy_ge.train(folder_path=model_folder, **_train_kwargs(ck_config))
+    dy_ge.static_ges[1].wait_for_checkpoint()
+    dy_ge.wait_for_saving()
+    assert sorted(listdir(model_folder)) == ["graph_0.json", "graph_0.pt"]
+    assert listdir(ck_folder) == ["graph_1_ck.pt"]
+    capsys.readouterr()
+
+    # Resume in a new process: as train_model with dyge_resume_training=True
+    dy_ge = TDynGE(graphs=graphs, embedding_dim=4)
+    ck_config = CheckpointConfig(number_saved=2, folder_path=ck_folder)
+    for i in range(len(graphs)):
+        dy_ge.train_at(model_index=i, folder_path=model_folder, is_load_from_previous_model=False,
+                       **_train_kwargs(ck_config))
+    dy_ge.wait_for_saving()
+
+    assert "Resume from epoch 4" in capsys.readouterr().out
+    assert listdir(ck_folder) == []
+    for i, g in enumerate(graphs):
+        assert exists(join(model_folder, f"graph_{i}.pt"))
+        assert dy_ge.static_ges[i].get_model().get_input_dim() == g.number_of_nodes()
+        assert dy_ge.get_embedding(i).shape == (g.number_of_nodes(), 4)
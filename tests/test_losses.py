@@ -0,0 +1,51 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sparse
+import torch
+
+from src.data_preprocessing.graph_preprocessing import get_edge_index
+from src.utils.losses import first_order_loss, second_order_loss
+
+
+def _random_graph_matrices(n=30, m=80, seed=6):
+    g = nx.gnm_random_graph(n=n, m=m, seed=seed)
+    rng = np.random.RandomState(seed)
+    for u, v in g.edges():
+        g[u][v]['weight'] = rng.uniform(0.5, 2.)
+    A = nx.to_scipy_sparse_matrix(g, format='csr', dtype=np.float64)
+    L = sparse.diags(np.asarray(A.sum(axis=1)).ravel()) - A
+    return A, L
+
+
+def test_first_order_loss_equals_laplacian_trace():
+    A, L = _random_graph_matrices()
+    Y = torch.randn(A.shape[0], 4, dtype=torch.float64, requires_grad=True)
+    edge_index, edge_weight = get_edge_index(A)
+
+    loss = first_order_loss(Y, torch.tensor(edge_index), torch.tensor(edge_weight, dtype=torch.float64))
+    grad, = torch.autograd.grad(loss, Y)
+    # Former dense loss: 2 * trace(Y^T L Y)
+    expected = 2 * torch.trace(Y.t() @ torch.tensor(L.toarray()) @ Y)
+    expected_grad, = torch.autograd.grad(expected, Y)
+
+    assert torch.allclose(loss, expected)
+    assert torch.allclose(grad, expected_grad)
+
+
+def test_second_order_loss_equals_dense_penalty():
+    A, _ = _random_graph_matrices()
+    beta = 8.
+    X = torch.tensor(A.toarray())
+    X_hat = torch.rand(A.shape, dtype=torch.float64, requires_grad=True)
+    x_index, x_value = get_edge_index(A)
+
+    loss = second_order_loss(X_hat, torch.tensor(x_index), torch.tensor(x_value, dtype=torch.float64), beta)
+    grad, = torch.autograd.grad(loss, X_hat)
+    # Former dense loss: sum(((X_hat - X) * B)^2), B = beta on the non-zero entries of X
+    B = torch.ones_like(X)
+    B[X != 0] = beta
+    expected = torch.sum(torch.square((X_hat - X) * B))
+    expected_grad, = torch.autograd.grad(expected, X_hat)
+
+    assert torch.allclose(loss, expected)
+    assert torch.allclose(grad, expected_grad)
@@ -0,0 +1,81 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.utils.graph_util import graph_to_csr
+from src.utils.precision_k_evaluate import rank_similarity_pairs, reconstruction_precision_k, check_link_predictionK
+
+
+def _argsort_precision_k(embedding, true_graph: nx.Graph, max_index, true_size, skip_graph: nx.Graph = None):
+    '''
+    Former Precision@K and AP: argsort of the N x N similarity matrix, then walk the pairs in descending order
+    '''
+    similarity = np.dot(embedding, embedding.T).reshape(-1)
+    node_size = embedding.shape[0]
+    K = 0
+    true_pred_count = 0
+    prec_k_list = []
+    precision_list = []
+    for ind in np.argsort(similarity)[::-1]:
+        u, v = ind // node_size, ind % node_size
+        if u == v or (skip_graph is not None and skip_graph.has_edge(u, v)):
+            continue
+        K += 1
+        if true_graph.has_edge(u, v):
+            true_pred_count += 1
+            if true_pred_count <= true_size:
+                precision_list.append(true_pred_count / K)
+        if K <= max_index:
+            prec_k_list.append(true_pred_count / K)
+        if true_pred_count > true_size and K > max_index:
+            break
+    return prec_k_list, np.sum(precision_list) / true_size
+
+
+def _random_setting(n=40, m=120, seed=6):
+    graph = nx.gnm_random_graph(n=n, m=m, seed=seed)
+    embedding = np.random.RandomState(seed).normal(size=(n, 3))
+    return graph, embedding
+
+
+@pytest.mark.parametrize('block_size', [7, 2048])
+def test_rank_similarity_pairs_matches_argsort(block_size):
+    graph, embedding = _random_setting()
+    max_k = 50
+    hits, hit_ranks = rank_similarity_pairs(embedding, true_adj=graph_to_csr(graph, node_size=len(embedding)),
+                                            max_k=max_k, block_size=block_size)
+
+    similarity = np.dot(embedding, embedding.T)
+    np.fill_diagonal(similarity, -np.inf)
+    order = np.argsort(-similarity.ravel(), kind='stable')[:len(embedding) * (len(embedding) - 1)]
+    is_true = np.array([graph.has_edge(ind // len(embedding), ind % len(embedding)) for ind in order])
+
+    np.testing.assert_array_equal(hits, is_true[:max_k])
+    np.testing.assert_array_equal(hit_ranks, np.flatnonzero(is_true) + 1)
+
+
+@pytest.mark.parametrize('block_size', [7, 2048])
+def test_reconstruction_precision_k_matches_argsort(block_size):
+    graph, embedding = _random_setting()
+    k_query = [1, 2, 10, 50]
+    k_query_res, AP = reconstruction_precision_k(embedding, graph, k_query=k_query, block_size=block_size)
+
+    prec_k_list, expected_AP = _argsort_precision_k(embedding, graph, max(k_query), graph.number_of_edges())
+    np.testing.assert_allclose(k_query_res, [prec_k_list[k - 1] for k in k_query])
+    assert AP == pytest.approx(expected_AP)
+
+
+@pytest.mark.parametrize('block_size', [7, 2048])
+def test_link_prediction_precision_k_matches_argsort(block_size):
+    origin_graph, embedding = _random_setting()
+    train_graph = origin_graph.copy()
+    removed_edges = list(origin_graph.edges())[::4]
+    train_graph.remove_edges_from(removed_edges)
+    k_query = [1, 2, 10, 50]
+    k_query_res, AP = check_link_predictionK(embedding, train_graph, origin_graph, k_query=k_query,
+                                             block_size=block_size)
+
+    prec_k_list, expected_AP = _argsort_precision_k(embedding, origin_graph, max(k_query), len(removed_edges),
+                                                    skip_graph=train_graph)
+    np.testing.assert_allclose(k_query_res, [prec_k_list[k - 1] for k in k_query])
+    assert AP == pytest.approx(expected_AP)
@@ -96,7 +96,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
     # g1 = nx.gnm_random_graph(n=10, m=15, seed=6)
     # g2 = nx.gnm_random_graph(n=15, m=30, seed=6)
@@ -146,7 +147,10 @@ if __name__ == "__main__":
         dy_ge, dy_embeddings = dyngem_alg(graphs=graphs, params=params)
         # Just use link prediction for last hidden graph
         hidden_dy_embedding = dy_embeddings[-1]
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=hidden_dy_embedding)
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=hidden_dy_embedding,
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
     # ============== Node2Vec ============
     if params.is_node2vec:
         create_folder(params.node2vec_emb_folder)
@@ -159,7 +163,10 @@ if __name__ == "__main__":
             index=len(graphs) - 1,
             folder_path=params.node2vec_emb_folder
         )
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0])
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0],
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
 
     # == == == == == == == = SDNE == == == == == ==
     if params.is_sdne:
@@ -172,4 +179,7 @@ if __name__ == "__main__":
             index=len(graphs) - 1
         )
 
-        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0])
+        link_pred_eva(g_hidden_df=g_hidden_df, hidden_dy_embedding=dy_embeddings[0],
+                      cache_folder=params.link_pred_cache_folder, top_k=params.top_k,
+                      g_hidden_partial=g_hidden_partial, idx2node=idx2node,
+                      show_acc_on_edge=params.show_acc_on_edge)
@@ -88,7 +88,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
     # g1 = nx.gnm_random_graph(n=10, m=15, seed=6)
     # g2 = nx.gnm_random_graph(n=15, m=30, seed=6)
@@ -110,7 +111,7 @@ if __name__ == "__main__":
         # -------- Training ----------
         dy_ge, dy_embeddings = dyngem_alg(graphs=graphs, params=params)
         print(f"Stability constant= {stability_constant(graphs=graphs, embeddings=dy_embeddings)}")
-        dy_reconstruction_accuracy(reconstructions=dy_ge.get_all_reconstructions(), graphs=graphs)
+        dy_reconstruction_accuracy(reconstructions=dy_ge.get_all_reconstructions(threshold=0.1), graphs=graphs)
     # ============== Node2Vec ============
     if params.is_node2vec:
         create_folder(params.node2vec_emb_folder)
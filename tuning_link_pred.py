@@ -32,13 +32,11 @@ if __name__ == "__main__":
                        alpha=alpha, beta=beta, activation=params.sdne_activation)
         print("\n====\nConfiguration:")
         print(f"Emb_dim={emb_dim}\t|alpha={alpha}\t|beta={beta}")
-        for lr in params.learning_rate_list:
-            print(f"\tLr={lr}")
-            ge.train(
-                batch_size=None, epochs=params.epochs, skip_print=params.skip_print,
-                learning_rate=lr, early_stop=params.early_stop,
-                plot_loss=True, shuffle=params.sdne_shuffle
-            )
+        ge.train(
+            batch_size=None, epochs=params.epochs, skip_print=params.skip_print,
+            learning_rate=params.learning_rate_list, early_stop=params.early_stop,
+            plot_loss=True, shuffle=params.sdne_shuffle
+        )
         _, mAP = check_link_predictionK(embedding=ge.get_embedding(), train_graph=g_hidden_partial,
                                         origin_graph=graph,
                                         k_query=[2, 10, 100, 200, 1000, 10000])
@@ -50,6 +48,7 @@ if __name__ == "__main__":
     params = {
         # 'folder_paths': {
         'dataset_folder': f"./data/{dataset_name}",
+        'compiled_dataset_folder': f"./saved_data/compiled/{dataset_name}",
         'processed_link_pred_data_folder': f"./saved_data/processed_data/{dataset_name}",
 
         'global_seed': 6,
@@ -90,7 +89,8 @@ if __name__ == "__main__":
     graphs, idx2node = read_dynamic_graph(
         folder_path=params.dataset_folder,
         limit=None,
-        convert_to_idx=True
+        convert_to_idx=True,
+        compiled_folder=params.compiled_dataset_folder
     )
 
     print("Number graphs: ", len(graphs))